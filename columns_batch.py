@@ -0,0 +1,453 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+import columns_grid
+import columns_headless
+import columns_rules
+
+
+def _table(predicate) -> bytes:
+    """
+    Returns a translation table that maps every packed cell code to 1 if the predicate holds for it
+    and to 0 otherwise.
+    """
+    return bytes(int(bool(predicate(code))) for code in range(256))
+
+
+_STACK = _table(lambda code: 0 < columns_grid.color_of(code) <= len(columns_grid.JEWELS)
+                and columns_grid.state_of(code) in (columns_grid.FROZEN, columns_grid.MATCHED))
+_FALLER = _table(lambda code: 0 < columns_grid.color_of(code) <= len(columns_grid.JEWELS)
+                 and columns_grid.state_of(code) in (columns_grid.FALLING, columns_grid.LANDED))
+_MATCHED = _table(lambda code: 0 < columns_grid.color_of(code) <= len(columns_grid.JEWELS)
+                  and columns_grid.state_of(code) == columns_grid.MATCHED)
+_WITHOUT_MATCHED = bytes(0 if _MATCHED[code] else code for code in range(256))
+_LANDING = bytes(columns_grid.LANDED | columns_grid.color_of(code) if _FALLER[code] else code for code in range(256))
+_FREEZING = bytes(columns_grid.color_of(code) if _FALLER[code] else code for code in range(256))
+
+
+class BoardBatch:
+    def __init__(self, seeds: [int], rows: int = 13, columns: int = 6, max_ticks: int = 100000) -> None:
+        """
+        Initializes one board for every seed, played by the same rules as HeadlessGame. All boards are
+        stored in one columns_grid.Grid: board after board, column by column, with an empty column after
+        every board. That column keeps runs from reaching across boards, so one find_matches call marks
+        the matches of every board at once, and clearing and finding the matched jewels and the stacks
+        are byte translations of the whole batch. Only the fallers are moved board by board, and only
+        the boards whose frozen jewels changed in a tick are matched again.
+        The fallers of each board are generated from its seed the same way HeadlessGame does.
+        """
+        self.rows = rows
+        self.columns = columns
+        self.height = rows + 3
+        self.stride = (columns + 1) * self.height
+        self.seeds = list(seeds)
+        self.max_ticks = max_ticks
+        self.grid = columns_grid.Grid(rows, len(self.seeds) * (columns + 1))
+        self.rngs = [random.Random(seed) for seed in self.seeds]
+        self.policy_rngs = [random.Random(f"{seed}-policy") for seed in self.seeds]
+        self.faller_columns = [-1] * len(self.seeds)
+        self.faller_tops = [0] * len(self.seeds)
+        self.faller_jewels = [[] for seed in self.seeds]
+        self.faller_landed = [False] * len(self.seeds)
+        self.settling = [False] * len(self.seeds)
+        self.ready = [True] * len(self.seeds)
+        self.ticks = [0] * len(self.seeds)
+        self.scores = [0] * len(self.seeds)
+        self.cascades = [0] * len(self.seeds)
+        self.fallers = [0] * len(self.seeds)
+        self.end_reasons = [None] * len(self.seeds)
+        self._unmatched_boards = set()
+
+    def __len__(self) -> int:
+        return len(self.seeds)
+
+    def live_boards(self) -> [int]:
+        """
+        Returns the indexes of the boards whose games have not ended.
+        """
+        return [board for board, end_reason in enumerate(self.end_reasons) if end_reason is None]
+
+    def board_grid(self, board: int) -> columns_grid.Grid:
+        """
+        Returns a copy of one board as a grid of its own.
+        """
+        start = board * self.stride
+        return columns_grid.Grid(self.rows, self.columns, self.grid.cells[start:start + self.stride - self.height])
+
+    def field(self, board: int) -> [[str]]:
+        """
+        Returns one board as a string field like the ones GameState updates.
+        """
+        return self.board_grid(board).to_field()
+
+    def load_grid(self, board: int, grid: columns_grid.Grid) -> None:
+        """
+        Replaces one board with the contents of a grid of the batch's size, the way GameState.load_grid
+        does. The grid must not hold a faller. The whole board is matched on the next tick.
+        """
+        if (grid.rows, grid.columns) != (self.rows, self.columns):
+            raise ValueError(f"cannot load a {grid.rows}x{grid.columns} grid into a {self.rows}x{self.columns} batch")
+        if 1 in grid.cells.translate(_FALLER):
+            raise ValueError("a grid loaded into a batch must not hold a faller")
+
+        start = board * self.stride
+        self.grid.cells[start:start + self.stride - self.height] = grid.cells
+        self.faller_columns[board] = -1
+        self.faller_jewels[board] = []
+        self.settling[board] = False
+        self._unmatched_boards.add(board)
+
+    def spawn(self, board: int) -> bool:
+        """
+        Creates the board's next faller and drops it. Returns False and ends the board's game if the
+        faller has no room to enter its column.
+        """
+        column, jewels = columns_rules.next_faller(self.rngs[board], self.columns)
+        if not self.drop(board, column - 1, jewels):
+            self.end_reasons[board] = "blocked"
+            return False
+
+        self.ready[board] = False
+        self.fallers[board] += 1
+        return True
+
+    def drop(self, board: int, column: int, jewels: [str]) -> bool:
+        """
+        Drops a faller into the column of the board the way GameState.drop does, and returns False if
+        there is no room for it.
+        """
+        stack_top = self._stack_top(board, column)
+        first_row = 0 if stack_top <= 3 else 1
+        faller_rows = range(first_row, min(first_row + len(jewels), stack_top))
+        if not faller_rows:
+            return False
+
+        self.faller_columns[board] = column
+        self.faller_tops[board] = faller_rows[0]
+        self.faller_jewels[board] = [columns_grid.color_of(columns_grid.encode_cell(f" {jewels[row - first_row]} "))
+                                     for row in faller_rows]
+        self.faller_landed[board] = False
+        self._write_faller(board)
+        if self._faller_supported(board):
+            self._land(board)
+        return True
+
+    def press(self, board: int, key: str) -> None:
+        """
+        Applies a key press ("LEFT", "RIGHT" or "SPACE") to the board's faller the way GameState does.
+        """
+        column = self.faller_columns[board]
+        if key not in columns_headless.KEYS:
+            raise ValueError(f"unknown key {key!r}")
+        if column < 0:
+            return
+
+        bottom = self.faller_tops[board] + len(self.faller_jewels[board]) - 1
+        if key == "SPACE":
+            jewels = self.faller_jewels[board]
+            self.faller_jewels[board] = [jewels[-1]] + jewels[:-1]
+            self._write_faller(board)
+        elif key == "LEFT" and column != 0 and bottom < self._stack_top(board, column - 1):
+            self._erase_faller(board)
+            self.faller_columns[board] = column - 1
+            if bottom + 1 < self.height:
+                self.faller_landed[board] = self._faller_supported(board)
+            self._write_faller(board)
+        elif key == "RIGHT" and column != self.columns - 1 and bottom < self._stack_top(board, column + 1):
+            self._erase_faller(board)
+            self.faller_columns[board] = column + 1
+            if bottom + 1 < self.height:
+                if not self._faller_supported(board):
+                    self.faller_landed[board] = False
+                elif 0 < self.grid.cells[self._index(board, column + 1, bottom + 1)] <= len(columns_grid.JEWELS):
+                    self.faller_landed[board] = True
+            self._write_faller(board)
+
+    def tick(self) -> None:
+        """
+        Runs the same steps as HeadlessGame.tick on every live board: the fallers fall, matches are marked
+        on the whole batch, the boards that had matched jewels are cleared and matched again, and the
+        boards whose stacks have reached the hidden rows end.
+        """
+        live = self.live_boards()
+        matched = self.grid.cells.translate(_MATCHED)
+        stride = self.stride
+        had_matches = [board for board in live if 1 in matched[board * stride:(board + 1) * stride]]
+
+        frozen = [board for board in live if self._fall(board) or board in self._unmatched_boards]
+        self._unmatched_boards.clear()
+        matched = self._match(frozen)
+        for board in had_matches:
+            self.scores[board] += matched.count(1, board * stride, (board + 1) * stride)
+            self.cascades[board] += 1
+            self._clear(board)
+        if had_matches:
+            matched = self._match(had_matches)
+        for board in live:
+            self._check_settled(board, matched)
+            self.ticks[board] += 1
+
+        stack = self.grid.cells.translate(_STACK)
+        height = self.height
+        hidden = int.from_bytes(stack[0::height], "big") | int.from_bytes(stack[1::height], "big") \
+            | int.from_bytes(stack[2::height], "big")
+        overflowing = hidden.to_bytes(len(stack) // height, "big")
+        column = overflowing.find(1)
+        while column != -1:
+            board = column // (self.columns + 1)
+            if self.end_reasons[board] is None and 1 not in matched[board * stride:(board + 1) * stride]:
+                self.end_reasons[board] = "game_over"
+            column = overflowing.find(1, column + 1)
+
+    def step(self, policy=None) -> int:
+        """
+        Plays one round of every live board the way HeadlessGame.play does: a board that is ready gets a
+        new faller and the keys that the policy returns for it, then every board ticks. The policy is
+        called with the batch and the index of the board. Returns the number of boards still playing.
+        """
+        for board in self.live_boards():
+            if self.ready[board] and self.spawn(board) and policy is not None:
+                for key in policy(self, board):
+                    self.press(board, key)
+
+        self.tick()
+        for board in self.live_boards():
+            if self.ticks[board] >= self.max_ticks:
+                self.end_reasons[board] = "tick_limit"
+        return len(self.live_boards())
+
+    def play(self, policy=None) -> [columns_headless.GameResult]:
+        """
+        Plays every board until its game ends and returns the results in the order of the seeds.
+        """
+        while self.step(policy):
+            pass
+        return self.results()
+
+    def results(self) -> [columns_headless.GameResult]:
+        """
+        Returns the result of every board so far, in the order of the seeds.
+        """
+        return [columns_headless.GameResult(seed, self.scores[board], self.cascades[board], self.ticks[board],
+                                            self.fallers[board], self.end_reasons[board])
+                for board, seed in enumerate(self.seeds)]
+
+    def _index(self, board: int, column: int, row: int) -> int:
+        """
+        Returns the position of a cell of a board in the batch's cell array.
+        """
+        return board * self.stride + column * self.height + row
+
+    def _stack_top(self, board: int, column: int) -> int:
+        """
+        Returns the row of the topmost jewel in the column that is not part of the faller, or the
+        number of cells in the column if it holds no such jewel.
+        """
+        start = self._index(board, column, 0)
+        stack_top = self.grid.cells[start:start + self.height].translate(_STACK).find(1)
+        return self.height if stack_top == -1 else stack_top
+
+    def _faller_supported(self, board: int) -> bool:
+        """
+        Returns True if the board's faller is on the bottom row or right above the stack in its column.
+        The faller is always above the stack, so only the cell right below it has to be looked at.
+        """
+        below = self.faller_tops[board] + len(self.faller_jewels[board])
+        return below >= self.height or _STACK[self.grid.cells[self._index(board, self.faller_columns[board], below)]]
+
+    def _write_faller(self, board: int) -> None:
+        """
+        Writes the board's faller into its column, in bars if it has landed and in brackets otherwise.
+        """
+        state = columns_grid.LANDED if self.faller_landed[board] else columns_grid.FALLING
+        start = self._index(board, self.faller_columns[board], self.faller_tops[board])
+        jewels = self.faller_jewels[board]
+        self.grid.cells[start:start + len(jewels)] = bytes(state | jewel for jewel in jewels)
+
+    def _erase_faller(self, board: int) -> None:
+        """
+        Empties the cells of the board's faller.
+        """
+        start = self._index(board, self.faller_columns[board], self.faller_tops[board])
+        self.grid.cells[start:start + len(self.faller_jewels[board])] = bytes(len(self.faller_jewels[board]))
+
+    def _restate_faller(self, board: int, table: bytes) -> None:
+        """
+        Changes the state of the cells of the board's faller with a translation table.
+        """
+        start = self._index(board, self.faller_columns[board], self.faller_tops[board])
+        end = start + len(self.faller_jewels[board])
+        self.grid.cells[start:end] = self.grid.cells[start:end].translate(table)
+
+    def _land(self, board: int) -> None:
+        """
+        Marks the board's faller as landed.
+        """
+        self.faller_landed[board] = True
+        self._restate_faller(board, _LANDING)
+
+    def _fall(self, board: int) -> bool:
+        """
+        Freezes the board's faller if it has landed, and otherwise lets it fall one row the way GameState.fall
+        does. Returns True if the faller froze.
+        """
+        if self.faller_columns[board] < 0 or self.faller_landed[board]:
+            return self._freeze(board)
+
+        if not self._faller_supported(board):
+            start = self._index(board, self.faller_columns[board], self.faller_tops[board])
+            end = start + len(self.faller_jewels[board])
+            self.grid.cells[start:end + 1] = b"\x00" + self.grid.cells[start:end]
+            self.faller_tops[board] += 1
+            if not self._faller_supported(board):
+                return False
+        self._land(board)
+        return False
+
+    def _freeze(self, board: int) -> bool:
+        """
+        Turns the board's landed faller into frozen jewels. Returns True if there was a faller to freeze.
+        """
+        if self.faller_columns[board] < 0 or not self.faller_landed[board]:
+            return False
+
+        self._restate_faller(board, _FREEZING)
+        self.faller_columns[board] = -1
+        self.faller_jewels[board] = []
+        self.settling[board] = True
+        return True
+
+    def _match(self, boards: [int]) -> bytearray:
+        """
+        Marks the matches of the given boards, all with one find_matches call on a grid holding just those
+        boards, and returns the mask of the matched jewels of the whole batch.
+        """
+        cells = self.grid.cells
+        stride = self.stride
+        if boards:
+            grid = columns_grid.Grid(self.rows, len(boards) * (self.columns + 1),
+                                     bytearray(b"".join(cells[board * stride:(board + 1) * stride] for board in boards)))
+            grid.mark_matches(columns_grid.find_matches(grid))
+            for position, board in enumerate(boards):
+                cells[board * stride:(board + 1) * stride] = grid.cells[position * stride:(position + 1) * stride]
+        return cells.translate(_MATCHED)
+
+    def _clear(self, board: int) -> None:
+        """
+        Deletes the board's matched jewels, lets the jewels of each of its columns fall to the bottom and
+        finds the faller again.
+        """
+        cells = self.grid.cells
+        height = self.height
+        start = board * self.stride
+        cells[start:start + self.stride] = cells[start:start + self.stride].translate(_WITHOUT_MATCHED)
+        for column_start in range(start, start + self.stride - height, height):
+            column = cells[column_start:column_start + height]
+            jewels = column.replace(b"\x00", b"")
+            if len(jewels) != height and column[height - len(jewels):] != jewels:
+                cells[column_start:column_start + height] = bytes(height - len(jewels)) + jewels
+
+        if self.faller_columns[board] >= 0:
+            column_start = self._index(board, self.faller_columns[board], 0)
+            top = cells[column_start:column_start + height].translate(_FALLER).find(1)
+            self.faller_tops[board] = top
+            self.faller_landed[board] = columns_grid.state_of(cells[column_start + top]) == columns_grid.LANDED
+        self.settling[board] = True
+
+    def _check_settled(self, board: int, matched: bytearray) -> None:
+        """
+        Gets the board ready for a new faller once a freeze or a clear has left no faller and no matched jewels.
+        """
+        if self.settling[board] and self.faller_columns[board] < 0 \
+                and 1 not in matched[board * self.stride:(board + 1) * self.stride]:
+            self.settling[board] = False
+            self.ready[board] = True
+
+
+def random_policy(batch: BoardBatch, board: int) -> [str]:
+    """
+    Presses a few random keys for every faller, the same keys columns_headless.random_policy presses in
+    a game with the same seed.
+    """
+    rng = batch.policy_rngs[board]
+    return [rng.choice(columns_headless.KEYS) for number in range(rng.randint(0, 6))]
+
+
+def no_moves_policy(batch: BoardBatch, board: int) -> [str]:
+    """
+    Leaves every faller where it was dropped.
+    """
+    return []
+
+
+POLICIES = {"none": no_moves_policy, "random": random_policy}
+HEADLESS_POLICIES = {"none": columns_headless.no_moves_policy, "random": columns_headless.random_policy}
+
+
+def verify(seeds: [int], rows: int = 13, columns: int = 6, max_ticks: int = 100000,
+           policy: str = "random") -> [(int, int)]:
+    """
+    Plays a HeadlessGame for every seed next to a batch of the same seeds, tick by tick, and returns the
+    (seed, tick) of every tick after which a board differs from its game, at most one per seed. The
+    field, the score and the end of every game are compared.
+    """
+    batch = BoardBatch(seeds, rows, columns, max_ticks)
+    games = [columns_headless.HeadlessGame(rows, columns, seed, HEADLESS_POLICIES[policy], max_ticks=max_ticks)
+             for seed in seeds]
+    mismatches = {}
+    while True:
+        for game in games:
+            if game.end_reason is None and game.ready_for_faller() and game.spawn() and game.policy is not None:
+                for key in game.policy(game):
+                    game.press(key)
+        for game in games:
+            if game.end_reason is None:
+                game.tick()
+                if game.end_reason is None and game.ticks >= game.max_ticks:
+                    game.end_reason = "tick_limit"
+
+        live = batch.step(POLICIES[policy])
+        for board, game in enumerate(games):
+            if board in mismatches or game.ticks != batch.ticks[board]:
+                continue
+            if columns_grid.Grid.from_field(game.field) != batch.board_grid(board) \
+                    or game.score != batch.scores[board] or game.end_reason != batch.end_reasons[board]:
+                mismatches[board] = (game.seed, game.ticks)
+
+        if not live and all(game.end_reason is not None for game in games):
+            return sorted(mismatches.values())
+
+
+def main(argv: [str] = None) -> None:
+    """
+    Plays a batch of games and writes one JSON line per game, or checks the batch against HeadlessGame.
+    """
+    parser = argparse.ArgumentParser(description="Play many Columns games in one batch.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--rows", type=int, default=13)
+    parser.add_argument("--columns", type=int, default=6)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    parser.add_argument("--max-ticks", type=int, default=100000)
+    parser.add_argument("--verify", action="store_true",
+                        help="play the games next to HeadlessGame and report every board that differs")
+    arguments = parser.parse_args(argv)
+
+    seeds = range(arguments.seed, arguments.seed + arguments.games)
+    if arguments.verify:
+        start = time.perf_counter()
+        mismatches = verify(seeds, arguments.rows, arguments.columns, arguments.max_ticks, arguments.policy)
+        sys.stdout.write(json.dumps({"games": arguments.games, "mismatches": mismatches,
+                                     "seconds": time.perf_counter() - start}) + "\n")
+        sys.exit(1 if mismatches else 0)
+
+    batch = BoardBatch(seeds, arguments.rows, arguments.columns, arguments.max_ticks)
+    for result in batch.play(POLICIES[arguments.policy]):
+        sys.stdout.write(json.dumps(result.as_dict()) + "\n")
+
+
+if __name__ == "__main__":
+    main()
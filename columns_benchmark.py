@@ -0,0 +1,409 @@
+import argparse
+import copy
+import gc
+import json
+import os
+import pickle
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import columns_cache
+import columns_loader
+import columns_mechanics
+import columns_rules
+import columns_search
+
+
+BOARD_SIZES = [(13, 6), (50, 20), (100, 50), (500, 200)]
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_REPEAT = 7
+SAMPLE_TIME = 0.05
+MAX_SETUP_TIME = 0.2
+IMPORT_BUDGETS = {"columns_mechanics": 0.05, "columns_headless": 0.1, "columns_visuals": 0.1}
+_IMPORT_PROBE = ("import sys, time\n"
+                 "start = time.perf_counter()\n"
+                 "import {module}\n"
+                 "print(time.perf_counter() - start, 'pygame' in sys.modules)\n")
+
+
+def random_contents(rows: int, columns: int, rng: random.Random, fill: float = 0.6) -> [[str]]:
+    """
+    Returns CONTENTS rows where the bottom part of every column is filled with random jewels.
+    """
+    heights = [int(rows * fill * rng.uniform(0.5, 1.0)) for column in range(columns)]
+    return [[f" {rng.choice(columns_rules.FALLER_JEWELS)} " if rows - row <= heights[column] else "   "
+             for column in range(columns)]
+            for row in range(rows)]
+
+
+def matching_contents(rows: int, columns: int) -> [[str]]:
+    """
+    Returns full CONTENTS rows where every row is a single color, so nearly every jewel is matched
+    horizontally and the next matching and clear touch the whole board.
+    """
+    jewels = columns_rules.FALLER_JEWELS
+    return [[f" {jewels[row // 3 % len(jewels)]} "] * columns for row in range(rows)]
+
+
+def cascade_contents(rows: int, columns: int) -> [[str]]:
+    """
+    Returns CONTENTS rows where every column holds a nested chain such as A A B B C C C B A (from the
+    bottom up): clearing the three C's lets the B's complete a run, then the A's, so every clear
+    starts another one until the chains are used up.
+    """
+    jewels = columns_rules.FALLER_JEWELS
+    depth = max(rows // 3, 1)
+    chain_columns = []
+    for column in range(columns):
+        colors = [jewels[(level * 2 + column * 3) % len(jewels)] for level in range(depth)]
+        bottom_up = [colors[0]] * 2
+        for level in range(1, depth):
+            bottom_up += [colors[level]] * 2
+        bottom_up += [colors[-1]]
+        for level in range(depth - 2, -1, -1):
+            bottom_up.append(colors[level])
+        bottom_up = bottom_up[:rows]
+        chain_columns.append([" "] * (rows - len(bottom_up)) + bottom_up[::-1])
+
+    return [[f" {chain_columns[column][row]} " for column in range(columns)] for row in range(rows)]
+
+
+def _contents_state(rows: int, columns: int, contents: [[str]]) -> (columns_mechanics.GameState, [[str]]):
+    """
+    Returns a game state and its field created from the CONTENTS rows.
+    """
+    game_state = columns_mechanics.GameState(rows, columns, "CONTENTS", contents)
+    return game_state, game_state.create_new_field()
+
+
+def _resolve_cascade(game_state: columns_mechanics.GameState, field: [[str]]) -> [[str]]:
+    """
+    Marks and clears matches the way the game loop does until no matches are left.
+    """
+    field = game_state.matching(field)
+    while game_state.checking_for_asterisks(field):
+        field = game_state.clear(field)
+        field = game_state.matching(field)
+    return field
+
+
+def _faller_state(rows: int, columns: int, rng: random.Random, landed: bool = False) \
+        -> (columns_mechanics.GameState, [[str]]):
+    """
+    Returns a game state with a random board and a faller dropped in the middle column that has
+    fallen a quarter of the way down, or has landed if landed is set.
+    """
+    contents = random_contents(rows, columns, rng, fill=0.3)
+    game_state, field = _contents_state(rows, columns, contents)
+    field = _resolve_cascade(game_state, field)
+    field = game_state.drop(field, columns // 2, [rng.choice(columns_rules.FALLER_JEWELS) for number in range(3)])
+    for number in range(rows // 4):
+        field = game_state.fall(field)
+    while landed and not any("|" in cell for cell in field[columns // 2]):
+        field = game_state.fall(field)
+    return game_state, field
+
+
+def _ready_state(prepare):
+    """
+    Builds a setup function that prepares a game state once and hands out an independent copy of it
+    for every timed call. The copies are unpickled, which is several times faster than deepcopy.
+    """
+    prepared = {}
+
+    def setup(rows: int, columns: int, seed: int):
+        key = (rows, columns, seed)
+        if key not in prepared:
+            prepared[key] = pickle.dumps(prepare(rows, columns, random.Random(seed)), pickle.HIGHEST_PROTOCOL)
+        return pickle.loads(prepared[key])
+
+    return setup
+
+
+def _setup_create_empty(rows: int, columns: int, seed: int):
+    return columns_mechanics.GameState(rows, columns, "EMPTY", None), None
+
+
+def _setup_text_board(rows: int, columns: int, seed: int):
+    contents = random_contents(rows, columns, random.Random(seed))
+    return [("".join(cell[1] for cell in line) + "\n").encode() for line in contents], None
+
+
+def _setup_create_contents(rows: int, columns: int, seed: int):
+    contents = random_contents(rows, columns, random.Random(seed))
+    return columns_mechanics.GameState(rows, columns, "CONTENTS", contents), None
+
+
+_setup_drop = _ready_state(lambda rows, columns, rng: _contents_state(rows, columns,
+                                                                      random_contents(rows, columns, rng, 0.3)))
+_setup_faller = _ready_state(lambda rows, columns, rng: _faller_state(rows, columns, rng))
+_setup_landed = _ready_state(lambda rows, columns, rng: _faller_state(rows, columns, rng, landed=True))
+_setup_random = _ready_state(lambda rows, columns, rng: _contents_state(rows, columns,
+                                                                        random_contents(rows, columns, rng)))
+_setup_matching = _ready_state(lambda rows, columns, rng: _contents_state(rows, columns,
+                                                                          matching_contents(rows, columns)))
+_setup_cascade = _ready_state(lambda rows, columns, rng: _contents_state(rows, columns,
+                                                                         cascade_contents(rows, columns)))
+
+
+def _setup_frozen(rows: int, columns: int, seed: int):
+    game_state, field = _setup_landed(rows, columns, seed)
+    return game_state, game_state.fall(field)
+
+
+def _setup_matched(rows: int, columns: int, seed: int):
+    game_state, field = _setup_matching(rows, columns, seed)
+    return game_state, game_state.matching(field)
+
+
+def _setup_snapshot(rows: int, columns: int, seed: int):
+    game_state, field = _setup_faller(rows, columns, seed)
+    return game_state, game_state.snapshot()
+
+
+def _setup_cached_cascade(rows: int, columns: int, seed: int):
+    game_state, field = _setup_cascade(rows, columns, seed)
+    primed_state, primed_field = _setup_cascade(rows, columns, seed)
+    game_state.resolution_cache = primed_state.resolution_cache = columns_cache.ResolutionCache()
+    primed_state.resolve_cascades(primed_field)
+    return game_state, field
+
+
+BENCHMARKS = {
+    "create_new_field[EMPTY]": (_setup_create_empty, lambda game_state, field: game_state.create_new_field()),
+    "create_new_field[CONTENTS]": (_setup_create_contents, lambda game_state, field: game_state.create_new_field()),
+    "load_text": (_setup_text_board, lambda lines, field: columns_loader.load_text(lines)),
+    "drop": (_setup_drop, lambda game_state, field: game_state.drop(field, len(field) // 2, ["S", "T", "V"])),
+    "rotate": (_setup_faller, lambda game_state, field: game_state.rotate(field)),
+    "move_left": (_setup_faller, lambda game_state, field: game_state.move_left(field)),
+    "move_right": (_setup_faller, lambda game_state, field: game_state.move_right(field)),
+    "fall": (_setup_faller, lambda game_state, field: game_state.fall(field)),
+    "fall[freeze]": (_setup_landed, lambda game_state, field: game_state.fall(field)),
+    "matching": (_setup_frozen, lambda game_state, field: game_state.matching(field)),
+    "matching[full_scan]": (_setup_matching, lambda game_state, field: game_state.matching(field, full_scan=True)),
+    "clear": (_setup_matched, lambda game_state, field: game_state.clear(field)),
+    "checking_for_asterisks": (_setup_matched, lambda game_state, field: game_state.checking_for_asterisks(field)),
+    "check_end_game": (_setup_random, lambda game_state, field: game_state.check_end_game(field, len(field[0]) - 3)),
+    "cascade": (_setup_cascade, _resolve_cascade),
+    "resolve_cascades": (_setup_cascade, lambda game_state, field: game_state.resolve_cascades(field)),
+    "resolve_cascades[cached]": (_setup_cached_cascade,
+                                 lambda game_state, field: game_state.resolve_cascades(field)),
+    "faller_placements": (_setup_faller, columns_search.faller_placements),
+    "deepcopy": (_setup_faller, lambda game_state, field: copy.deepcopy((game_state, field))),
+    "snapshot": (_setup_faller, lambda game_state, field: game_state.snapshot()),
+    "restore": (_setup_snapshot, lambda game_state, snapshot: game_state.restore(snapshot)),
+}
+
+
+def _prepare_states(name: str, rows: int, columns: int, seed: int, number: int) -> (list, float):
+    """
+    Prepares a game state for each of number calls of a benchmark and returns them together with
+    the time it took to prepare them in seconds.
+    """
+    setup = BENCHMARKS[name][0]
+    start = time.perf_counter()
+    states = [setup(rows, columns, seed) for call in range(number)]
+    return states, time.perf_counter() - start
+
+
+def _time_calls(name: str, states: list) -> float:
+    """
+    Calls the operation of a benchmark once on every prepared state and returns how long that took
+    in seconds. The garbage collector is switched off meanwhile, as timeit does.
+    """
+    operation = BENCHMARKS[name][1]
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for game_state, argument in states:
+            operation(game_state, argument)
+        return time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def calls_per_sample(name: str, rows: int, columns: int, seed: int = 0, sample_time: float = SAMPLE_TIME) -> int:
+    """
+    Returns how many calls of a benchmark one sample times. Like timeit.Timer.autorange, the number
+    of calls grows until a sample takes at least sample_time seconds, unless preparing the game states
+    for that many calls would take more than MAX_SETUP_TIME seconds.
+    """
+    number = 1
+    while True:
+        states, setup_seconds = _prepare_states(name, rows, columns, seed, number)
+        seconds = _time_calls(name, states)
+        del states
+        affordable = max(number, int(MAX_SETUP_TIME * number / setup_seconds)) if setup_seconds else number * 10
+        if seconds >= sample_time or number >= affordable:
+            return number
+        wanted = int(sample_time * number / seconds * 1.1) + 1 if seconds else number * 10
+        number = min(max(wanted, number * 2), number * 10, affordable)
+
+
+def time_sample(name: str, rows: int, columns: int, number: int, seed: int = 0) -> float:
+    """
+    Times one sample of number calls of a benchmark, each on its own game state prepared before the
+    sample is timed, and returns the time per call in seconds.
+    """
+    states = _prepare_states(name, rows, columns, seed, number)[0]
+    return _time_calls(name, states) / number
+
+
+def _summarize(samples: [float], number: int) -> dict:
+    """
+    Returns the fastest and the median time per call of the samples.
+    """
+    return {"min": min(samples), "median": statistics.median(samples), "repeat": len(samples), "number": number}
+
+
+def time_benchmark(name: str, rows: int, columns: int, repeat: int = DEFAULT_REPEAT, seed: int = 0) -> dict:
+    """
+    Times one benchmark on a board of the given size. Returns the fastest and the median time per call
+    in seconds over repeat samples, and the number of calls per sample.
+    """
+    number = calls_per_sample(name, rows, columns, seed)
+    return _summarize([time_sample(name, rows, columns, number, seed) for sample in range(repeat)], number)
+
+
+def run_benchmarks(names: [str] = None, sizes: [(int, int)] = None, repeat: int = DEFAULT_REPEAT, seed: int = 0,
+                   report=None) -> dict:
+    """
+    Times every benchmark on every board size and returns the results keyed by "name@rowsxcolumns".
+    The samples are taken in rounds over all of the benchmarks rather than one benchmark after another,
+    so a few seconds in which the machine runs slowly spoil one sample of several benchmarks instead of
+    every sample of one, and the fastest sample stays close to the true time. The report function, if
+    given, is called with each key and result once every round has been run.
+    """
+    runs = {}
+    for rows, columns in sizes or BOARD_SIZES:
+        for name in names or BENCHMARKS:
+            runs[f"{name}@{rows}x{columns}"] = (name, rows, columns, calls_per_sample(name, rows, columns, seed))
+
+    samples = {key: [] for key in runs}
+    for sample in range(repeat):
+        for key, (name, rows, columns, number) in runs.items():
+            samples[key].append(time_sample(name, rows, columns, number, seed))
+
+    results = {}
+    for key, (name, rows, columns, number) in runs.items():
+        results[key] = _summarize(samples[key], number)
+        if report is not None:
+            report(key, results[key])
+
+    return results
+
+
+def time_import(module: str, repeat: int = 5) -> dict:
+    """
+    Times importing the module in a fresh interpreter, repeat times. Returns the fastest and the median
+    time in seconds and whether the import loaded pygame.
+    """
+    samples = []
+    loads_pygame = False
+    for sample in range(repeat):
+        output = subprocess.run([sys.executable, "-c", _IMPORT_PROBE.format(module=module)], capture_output=True,
+                                text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        seconds, loaded = output.split()
+        samples.append(float(seconds))
+        loads_pygame = loads_pygame or loaded == "True"
+
+    return {"min": min(samples), "median": statistics.median(samples), "repeat": repeat,
+            "loads_pygame": loads_pygame}
+
+
+def check_import_budgets(budgets: dict = None, repeat: int = 5, report=None) -> [str]:
+    """
+    Times importing every module of the budgets and returns a description of every module that took
+    longer than its budget, in seconds, or that loaded pygame. The report function, if given, is called
+    with each module and result as soon as it is measured.
+    """
+    problems = []
+    for module, budget in (budgets or IMPORT_BUDGETS).items():
+        result = time_import(module, repeat)
+        if report is not None:
+            report(module, result)
+        if result["min"] > budget:
+            problems.append(f"importing {module} took {result['min'] * 1000:.1f} ms, "
+                            f"over its budget of {budget * 1000:.1f} ms")
+        if result["loads_pygame"]:
+            problems.append(f"importing {module} loaded pygame")
+
+    return problems
+
+
+def compare(results: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> [(str, float)]:
+    """
+    Returns the (key, ratio) pairs of every benchmark whose fastest time is more than the threshold
+    slower than in the baseline. The allowed slowdown is widened by how far the median time of the
+    baseline was above its fastest time, so a benchmark that is noisy on this machine has to slow down
+    by more than its own noise to count as a regression.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key in baseline and baseline[key]["min"] > 0:
+            ratio = result["min"] / baseline[key]["min"]
+            noise = baseline[key].get("median", baseline[key]["min"]) / baseline[key]["min"]
+            if ratio > (1 + threshold) * noise:
+                regressions.append((key, ratio))
+
+    return regressions
+
+
+def main(argv: [str] = None) -> int:
+    """
+    Runs the benchmarks, optionally saves them as a baseline or compares them with one, and returns
+    1 if a regression was found.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the GameState operations.")
+    parser.add_argument("--benchmark", action="append", choices=sorted(BENCHMARKS), help="benchmark to run")
+    parser.add_argument("--size", action="append", help="board size as ROWSxCOLUMNS")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", metavar="JSON", help="write the results to this baseline file")
+    parser.add_argument("--compare", metavar="JSON", help="compare the results with this baseline file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown before a benchmark counts as a regression, on top of its noise")
+    parser.add_argument("--imports", action="store_true",
+                        help="check the import times against their budgets instead of running the benchmarks")
+    arguments = parser.parse_args(argv)
+
+    if arguments.imports:
+        def report_import(module: str, result: dict) -> None:
+            print(f"import {module:38} {result['min'] * 1000:12.3f} ms  (median {result['median'] * 1000:.3f} ms)")
+
+        problems = check_import_budgets(repeat=arguments.repeat, report=report_import)
+        for problem in problems:
+            print(f"OVER BUDGET {problem}")
+        return 1 if problems else 0
+
+    sizes = [tuple(int(number) for number in size.split("x")) for size in arguments.size or []]
+
+    def report(key: str, result: dict) -> None:
+        print(f"{key:45} {result['min'] * 1000:12.3f} ms  (median {result['median'] * 1000:.3f} ms)")
+
+    results = run_benchmarks(arguments.benchmark, sizes, arguments.repeat, arguments.seed, report)
+
+    if arguments.save:
+        with open(arguments.save, "w") as baseline_file:
+            json.dump({"python": platform.python_version(), "results": results}, baseline_file, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+        regressions = compare(results, baseline, arguments.threshold)
+        for key, ratio in regressions:
+            print(f"REGRESSION {key}: {ratio:.2f}x the baseline time")
+        if regressions:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
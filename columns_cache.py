@@ -0,0 +1,136 @@
+import functools
+from collections import OrderedDict
+
+import columns_grid
+
+
+_MASK_64 = (1 << 64) - 1
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def cell_key(index: int, code: int) -> int:
+    """
+    Returns the 64-bit Zobrist key of a packed cell code at a position of the flat cell array.
+    The keys are mixed on the fly with the splitmix64 finalizer instead of being stored in a table
+    for every position, so boards of any size get keys; only the most recently used keys are kept.
+    Empty cells have the key 0, so an empty board hashes to 0.
+    """
+    if code == columns_grid.EMPTY:
+        return 0
+    return _mix(index, code)
+
+
+def _mix(index: int, code: int) -> int:
+    """
+    Returns the key of a non-empty cell without going through the cache of cell_key.
+    """
+    value = ((index << 6 | code) + 1) * 0x9E3779B97F4A7C15 & _MASK_64
+    value = (value ^ value >> 30) * 0xBF58476D1CE4E5B9 & _MASK_64
+    value = (value ^ value >> 27) * 0x94D049BB133111EB & _MASK_64
+    return value ^ value >> 31
+
+
+def board_hash(field: [[str]]) -> int:
+    """
+    Returns the Zobrist hash of a string field: the XOR of the keys of all of its cells.
+    """
+    value = 0
+    index = 0
+    for column in field:
+        for cell in column:
+            if cell != "   ":
+                value ^= cell_key(index, columns_grid.encode_cell(cell))
+            index += 1
+
+    return value
+
+
+def cells_hash(cells: bytes) -> int:
+    """
+    Returns the Zobrist hash of packed cells, such as the cells of a grid. The keys are mixed directly
+    rather than looked up through cell_key, so hashing a large board that has just been loaded does
+    not push the keys of the board being played out of the cache.
+    """
+    value = 0
+    for index, code in enumerate(cells):
+        if code:
+            value ^= _mix(index, code)
+
+    return value
+
+
+def rehash(value: int, previous_cells: bytes, cells: bytes) -> int:
+    """
+    Returns the hash of the packed cells given the hash of the previous cells, by replacing the keys
+    of only the cells that differ.
+    """
+    for index, (previous_code, code) in enumerate(zip(previous_cells, cells)):
+        if previous_code != code:
+            value ^= cell_key(index, previous_code) ^ cell_key(index, code)
+
+    return value
+
+
+class ResolutionCache:
+    def __init__(self, size: int = 4096) -> None:
+        """
+        Initializes a cache of at most size resolved boards. It maps the hash of a board to the board
+        itself and the board it settles into once every cascade has been resolved, so a board that has
+        been seen before does not have to be matched and cleared again. The least recently used board
+        is dropped when the cache is full.
+        """
+        if size < 1:
+            raise ValueError("the cache size must be at least 1")
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: tuple, source: bytes = None):
+        """
+        Returns the entry stored for the key and marks it as recently used, or returns None if there is
+        no such entry. If the source board is given, an entry that was stored for a different board whose
+        hash collides with it is treated as missing. Every call counts as a hit or a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is None or source is not None and entry[0] != source:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: tuple, entry) -> None:
+        """
+        Stores an entry for the key, dropping the least recently used entry if the cache is full.
+        """
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Drops every entry and resets the statistics.
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the number of entries, hits and misses and the hit rate of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {"size": self.size, "entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._entries
+
+    def __repr__(self) -> str:
+        return f"ResolutionCache(size={self.size}, entries={len(self._entries)})"
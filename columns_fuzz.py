@@ -0,0 +1,478 @@
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import columns_batch
+import columns_grid
+import columns_headless
+import columns_mechanics
+import columns_reference
+
+
+DROP = "drop"
+KEY = "key"
+TICK = "tick"
+RESOLVE = "resolve"
+
+_FALLER_CELLS = bytes(int(columns_grid.state_of(code) in (columns_grid.FALLING, columns_grid.LANDED)
+                          and columns_grid.color_of(code) != 0) for code in range(256))
+_UNSETTLED_CELLS = bytes(int(_FALLER_CELLS[code] or columns_grid.state_of(code) == columns_grid.MATCHED
+                             and columns_grid.color_of(code) != 0) for code in range(256))
+
+
+class FuzzCase:
+    def __init__(self, rows: int, columns: int, cells: bytes, actions: [tuple], seed: int = None) -> None:
+        """
+        Initializes one generated case: the size of the board, its packed cells (a settled board without a
+        faller), the actions played on it and the seed the case was generated from, if any. Every action
+        is ("drop", column, jewels), ("key", key), ("tick",) or ("resolve",); a tick runs the same steps as
+        a timer event, and a resolve clears every cascade on the board at once.
+        """
+        self.rows = rows
+        self.columns = columns
+        self.cells = bytes(cells)
+        self.actions = [tuple(action) for action in actions]
+        self.seed = seed
+
+    def grid(self) -> columns_grid.Grid:
+        """
+        Returns a copy of the board as a grid.
+        """
+        return columns_grid.Grid(self.rows, self.columns, bytearray(self.cells))
+
+    def as_dict(self) -> dict:
+        """
+        Returns the case as a dictionary that can be written out as JSON, with the board as a string field.
+        """
+        return {"seed": self.seed, "rows": self.rows, "columns": self.columns, "field": self.grid().to_field(),
+                "actions": [list(action) for action in self.actions]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FuzzCase":
+        """
+        Creates a case from a dictionary written by as_dict.
+        """
+        cells = columns_grid.Grid.from_field(data["field"]).cells
+        return cls(data["rows"], data["columns"], cells, data["actions"], data.get("seed"))
+
+    def __repr__(self) -> str:
+        return f"FuzzCase(rows={self.rows}, columns={self.columns}, actions={len(self.actions)}, seed={self.seed})"
+
+
+class ReferenceEngine:
+    def __init__(self, rows: int, columns: int, grid: columns_grid.Grid) -> None:
+        """
+        Initializes the reference engine: the original GameState of columns_reference, playing on a
+        string field made from the grid.
+        """
+        self.rows = rows
+        self.game_state = columns_reference.GameState(rows, columns, "EMPTY", None)
+        self.field = grid.to_field()
+
+    def drop(self, column: int, jewels: [str]) -> bool:
+        try:
+            self.field = self.game_state.drop(self.field, column, list(jewels))
+        except IndexError:
+            return False
+        return True
+
+    def press(self, key: str) -> None:
+        if key == "LEFT":
+            self.field = self.game_state.move_left(self.field)
+        elif key == "RIGHT":
+            self.field = self.game_state.move_right(self.field)
+        else:
+            self.field = self.game_state.rotate(self.field)
+
+    def tick(self) -> bool:
+        """
+        Runs the steps of a timer event in Game and returns True if the game is over.
+        """
+        game_state = self.game_state
+        asterisks_present = game_state.checking_for_asterisks(self.field)
+        self.field = game_state.fall(self.field)
+        self.field = game_state.matching(self.field)
+        if asterisks_present:
+            self.field = game_state.clear(self.field)
+            self.field = game_state.matching(self.field)
+        return game_state.check_end_game(self.field, self.rows)
+
+    def resolve(self) -> None:
+        """
+        Marks and clears matches the way the ticks of the game loop do until no matches are left.
+        """
+        game_state = self.game_state
+        self.field = game_state.matching(self.field)
+        while game_state.checking_for_asterisks(self.field):
+            self.field = game_state.clear(self.field)
+            self.field = game_state.matching(self.field)
+
+    def cells(self) -> bytes:
+        return bytes(columns_grid.Grid.from_field(self.field).cells)
+
+
+class GameStateEngine:
+    full_scan = False
+
+    def __init__(self, rows: int, columns: int, grid: columns_grid.Grid) -> None:
+        """
+        Initializes an engine on a GameState that keeps updating the field it returned last, the way
+        Game and HeadlessGame use it.
+        """
+        self.rows = rows
+        self.game_state = columns_mechanics.GameState(rows, columns, "EMPTY", None)
+        self.field = self.game_state.load_grid(grid)
+
+    def drop(self, column: int, jewels: [str]) -> bool:
+        try:
+            self.field = self.game_state.drop(self._field(), column, list(jewels))
+        except IndexError:
+            return False
+        return True
+
+    def press(self, key: str) -> None:
+        if key == "LEFT":
+            self.field = self.game_state.move_left(self._field())
+        elif key == "RIGHT":
+            self.field = self.game_state.move_right(self._field())
+        else:
+            self.field = self.game_state.rotate(self._field())
+
+    def tick(self) -> bool:
+        """
+        Runs the steps of columns_rules.run_tick and returns True if the game is over.
+        """
+        game_state = self.game_state
+        asterisks_present = game_state.checking_for_asterisks(self._field())
+        self.field = game_state.fall(self._field())
+        self.field = game_state.matching(self._field(), self.full_scan)
+        if asterisks_present:
+            self.field = game_state.clear(self._field())
+            self.field = game_state.matching(self._field(), self.full_scan)
+        return game_state.check_end_game(self._field(), self.rows)
+
+    def resolve(self) -> None:
+        field = self._field()
+        self.game_state.resolve_cascades(field)
+        self.field = field
+
+    def cells(self) -> bytes:
+        return bytes(columns_grid.Grid.from_field(self.field).cells)
+
+    def _field(self) -> [[str]]:
+        """
+        Returns the field to hand to the next GameState call.
+        """
+        return self.field
+
+
+class FullScanEngine(GameStateEngine):
+    """
+    A GameState that scans the whole field for matches on every tick instead of only the lines through
+    the cells that changed.
+    """
+
+    full_scan = True
+
+
+class UntrackedEngine(GameStateEngine):
+    """
+    A GameState that is handed a copy of its field on every call, so it has to find the faller, the
+    column heights, the matched jewels and the board hash again each time instead of keeping them up to date.
+    """
+
+    def _field(self) -> [[str]]:
+        return [list(column) for column in self.field]
+
+
+class SnapshotEngine(GameStateEngine):
+    """
+    A GameState that is replaced by a new one restored from its snapshot after every action.
+    """
+
+    def cells(self) -> bytes:
+        restored = columns_mechanics.GameState(self.game_state.rows, self.game_state.columns, "EMPTY", None)
+        self.field = restored.restore(self.game_state.snapshot())
+        self.game_state = restored
+        return super().cells()
+
+
+class BatchEngine:
+    def __init__(self, rows: int, columns: int, grid: columns_grid.Grid) -> None:
+        """
+        Initializes an engine that plays the case on the only board of a columns_batch.BoardBatch.
+        """
+        self.batch = columns_batch.BoardBatch([0], rows, columns)
+        self.batch.load_grid(0, grid)
+
+    def drop(self, column: int, jewels: [str]) -> bool:
+        return self.batch.drop(0, column, list(jewels))
+
+    def press(self, key: str) -> None:
+        self.batch.press(0, key)
+
+    def tick(self) -> bool:
+        self.batch.tick()
+        return self.batch.end_reasons[0] == "game_over"
+
+    def resolve(self) -> None:
+        """
+        Resolves the board's cascades with Grid.resolve_cascades, as the batch has no call of its own for it.
+        """
+        grid = self.batch.board_grid(0)
+        grid.resolve_cascades()
+        self.batch.load_grid(0, grid)
+
+    def cells(self) -> bytes:
+        return bytes(self.batch.board_grid(0).cells)
+
+
+REFERENCE = "reference"
+ENGINES = {REFERENCE: ReferenceEngine, "game_state": GameStateEngine, "full_scan": FullScanEngine,
+           "untracked": UntrackedEngine, "snapshot": SnapshotEngine, "batch": BatchEngine}
+
+
+def generate_case(seed: int, max_actions: int = 200) -> FuzzCase:
+    """
+    Generates a case from the seed: a board of random size with a few colors, so that runs are common,
+    stacked to random heights that may reach into the hidden rows, and a random sequence of drops, key
+    presses, ticks and resolves.
+    """
+    rng = random.Random(seed)
+    rows = rng.randint(3, 14)
+    columns = rng.randint(1, 8)
+    jewels = columns_grid.JEWELS[:rng.randint(2, len(columns_grid.JEWELS))]
+    height = rows + 3
+    cells = bytearray()
+    for column in range(columns):
+        stack = rng.choice((0, 0, rng.randint(0, rows // 2), rng.randint(0, height)))
+        cells += bytes(height - stack)
+        cells += bytes(columns_grid.encode_cell(f" {rng.choice(jewels)} ") for row in range(stack))
+
+    actions = []
+    for number in range(rng.randint(1, max_actions)):
+        kind = rng.random()
+        if kind < 0.12:
+            actions.append((DROP, rng.randrange(columns), [rng.choice(jewels) for jewel in range(3)]))
+        elif kind < 0.15:
+            actions.append((RESOLVE,))
+        elif kind < 0.45:
+            actions.append((KEY, rng.choice(columns_headless.KEYS)))
+        else:
+            actions.append((TICK,))
+
+    return FuzzCase(rows, columns, cells, actions, seed)
+
+
+def _settled(case: FuzzCase, cells: bytes) -> bool:
+    """
+    Returns True if the board holds no faller, no matched jewels and no runs that are still to be matched,
+    which is when Game drops the next faller. The original GameState only works on boards that Game can
+    reach, so no faller is dropped onto a board that is still being cleared.
+    """
+    if 1 in cells.translate(_UNSETTLED_CELLS):
+        return False
+    return not columns_grid.match_coordinates(columns_grid.Grid(case.rows, case.columns, bytearray(cells)))
+
+
+def run_case(case: FuzzCase, engine_name: str) -> [tuple]:
+    """
+    Plays the case on a new engine and returns what was observed after every action: the packed cells
+    and whether a drop found room or a tick ended the game, or the error an action raised. A drop is
+    skipped until the board has settled, and a resolve while the board holds a faller. The case stops
+    after a drop without room, the end of the game or an error.
+    """
+    observations = []
+    try:
+        engine = ENGINES[engine_name](case.rows, case.columns, case.grid())
+        cells = engine.cells()
+        for action in case.actions:
+            if action[0] == DROP and not _settled(case, cells) \
+                    or action[0] == RESOLVE and 1 in cells.translate(_FALLER_CELLS):
+                observations.append((cells, "skipped"))
+                continue
+            if action[0] == DROP:
+                outcome = engine.drop(action[1], action[2])
+            elif action[0] == KEY:
+                outcome = engine.press(action[1])
+            elif action[0] == RESOLVE:
+                outcome = engine.resolve()
+            else:
+                outcome = engine.tick()
+            cells = engine.cells()
+            observations.append((cells, outcome))
+            if (action[0] == DROP and not outcome) or (action[0] == TICK and outcome):
+                break
+    except Exception as error:
+        observations.append(("error", type(error).__name__))
+
+    return observations
+
+
+def divergence(case: FuzzCase, engine_name: str) -> int:
+    """
+    Returns the index of the first action after which the engine observed something else than the
+    reference, or None if they agree on the whole case.
+    """
+    expected = run_case(case, REFERENCE)
+    observed = run_case(case, engine_name)
+    for index, (expected_observation, observation) in enumerate(zip(expected, observed)):
+        if expected_observation != observation:
+            return index
+    if len(expected) != len(observed):
+        return min(len(expected), len(observed))
+    return None
+
+
+def _without_jewel(case: FuzzCase, index: int) -> FuzzCase:
+    """
+    Returns a copy of the case with one jewel taken off the board and the column settled again.
+    """
+    grid = case.grid()
+    grid.cells[index] = columns_grid.EMPTY
+    grid.apply_gravity()
+    return FuzzCase(case.rows, case.columns, grid.cells, case.actions, case.seed)
+
+
+def _smaller_boards(case: FuzzCase) -> [FuzzCase]:
+    """
+    Returns copies of the case on a board with one column less, where drops into the last column go
+    into the new last column instead, and on a board with one row less, without the top visible row.
+    """
+    height = case.rows + 3
+    candidates = []
+    if case.columns > 1:
+        actions = [(DROP, min(action[1], case.columns - 2), action[2]) if action[0] == DROP else action
+                   for action in case.actions]
+        candidates.append(FuzzCase(case.rows, case.columns - 1, case.cells[:-height], actions, case.seed))
+    if case.rows > 1:
+        grid = columns_grid.Grid(case.rows - 1, case.columns,
+                                 bytearray(b"".join(case.cells[start:start + 3] + case.cells[start + 4:start + height]
+                                                    for start in range(0, len(case.cells), height))))
+        grid.apply_gravity()
+        candidates.append(FuzzCase(case.rows - 1, case.columns, grid.cells, case.actions, case.seed))
+    return candidates
+
+
+def shrink(case: FuzzCase, engine_name: str) -> FuzzCase:
+    """
+    Shrinks a case on which the engine diverges from the reference into a smaller one on which it still
+    does: the actions after the divergence are cut off, then runs of actions are left out, from long
+    runs to single actions, then the board loses columns and rows and its jewels are taken off one at
+    a time, until nothing more can be removed.
+    """
+    index = divergence(case, engine_name)
+    if index is None:
+        return case
+    case = FuzzCase(case.rows, case.columns, case.cells, case.actions[:index + 1], case.seed)
+
+    changed = True
+    while changed:
+        changed = False
+        size = max(len(case.actions) // 2, 1)
+        while size >= 1:
+            start = 0
+            while start < len(case.actions):
+                candidate = FuzzCase(case.rows, case.columns, case.cells,
+                                     case.actions[:start] + case.actions[start + size:], case.seed)
+                if candidate.actions and divergence(candidate, engine_name) is not None:
+                    case = candidate
+                    changed = True
+                else:
+                    start += size
+            size //= 2
+
+        for candidate in _smaller_boards(case):
+            if divergence(candidate, engine_name) is not None:
+                case = candidate
+                changed = True
+                break
+
+        index = 0
+        while index < len(case.cells):
+            if case.cells[index] != columns_grid.EMPTY:
+                candidate = _without_jewel(case, index)
+                if divergence(candidate, engine_name) is not None:
+                    case = candidate
+                    changed = True
+                    continue
+            index += 1
+
+    return case
+
+
+def _check_seed(arguments: tuple) -> (int, [dict]):
+    """
+    Generates the case of one seed in a worker process, checks every engine against the reference on it
+    and returns the seed and a shrunk case for every engine that diverged.
+    """
+    seed, engine_names, max_actions = arguments
+    case = generate_case(seed, max_actions)
+    failures = []
+    for engine_name in engine_names:
+        if divergence(case, engine_name) is not None:
+            failures.append({"engine": engine_name, "case": shrink(case, engine_name).as_dict()})
+    return seed, failures
+
+
+def fuzz(seeds, engine_names: [str] = None, max_actions: int = 200, processes: int = None, chunksize: int = 16):
+    """
+    Checks the engines against the reference on the case of every seed across a pool of worker processes
+    and yields (seed, failures) for every seed as soon as it has been checked, in no particular order.
+    With one process the cases are checked in this process.
+    """
+    if engine_names is None:
+        engine_names = [engine_name for engine_name in ENGINES if engine_name != REFERENCE]
+    arguments = ((seed, list(engine_names), max_actions) for seed in seeds)
+    if processes == 1:
+        yield from map(_check_seed, arguments)
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(_check_seed, arguments, chunksize)
+
+
+def main(argv: [str] = None) -> None:
+    """
+    Fuzzes the engines against the reference and writes every shrunk failing case as a line of JSON,
+    or replays a case written earlier and reports where each engine diverges on it.
+    """
+    parser = argparse.ArgumentParser(description="Compare the Columns engines with the original GameState "
+                                                 "on random cases.")
+    parser.add_argument("--cases", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first case")
+    parser.add_argument("--engines", nargs="+", choices=sorted(set(ENGINES) - {REFERENCE}),
+                        help="engines to check (all of them by default)")
+    parser.add_argument("--max-actions", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--replay", metavar="JSON", help="replay a failing case written by an earlier run")
+    arguments = parser.parse_args(argv)
+
+    if arguments.replay is not None:
+        with open(arguments.replay) as case_file:
+            data = json.loads(case_file.readline())
+        case = FuzzCase.from_dict(data.get("case", data))
+        engine_names = arguments.engines
+        if engine_names is None:
+            engine_names = [data["engine"]] if "engine" in data else sorted(set(ENGINES) - {REFERENCE})
+        for engine_name in engine_names:
+            sys.stdout.write(json.dumps({"engine": engine_name, "divergence": divergence(case, engine_name)}) + "\n")
+        return
+
+    start = time.perf_counter()
+    failed = 0
+    seeds = range(arguments.seed, arguments.seed + arguments.cases)
+    for seed, failures in fuzz(seeds, arguments.engines, arguments.max_actions, arguments.processes):
+        for failure in failures:
+            failed += 1
+            sys.stdout.write(json.dumps(failure) + "\n")
+
+    sys.stderr.write(f"{arguments.cases} cases, {failed} failures in {time.perf_counter() - start:.1f} s\n")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
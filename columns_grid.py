@@ -0,0 +1,286 @@
+import re
+from itertools import chain
+
+
+JEWELS = "STUVWXYZ"
+
+EMPTY = 0x00
+FROZEN = 0x00
+FALLING = 0x10
+LANDED = 0x20
+MATCHED = 0x30
+
+COLOR_MASK = 0x0F
+STATE_MASK = 0x30
+
+_STATE_DECORATIONS = {FROZEN: " {} ", FALLING: "[{}]", LANDED: "|{}|", MATCHED: "*{}*"}
+
+_DECODE = ["   "] * 256
+_ENCODE = {"   ": EMPTY}
+for _state, _decoration in _STATE_DECORATIONS.items():
+    for _color, _jewel in enumerate(JEWELS, 1):
+        _DECODE[_state | _color] = _decoration.format(_jewel)
+        _ENCODE[_decoration.format(_jewel)] = _state | _color
+_DECODE = tuple(_DECODE)
+
+_FROZEN_COLORS = bytes(code if 0 < code <= len(JEWELS) else 0 for code in range(256))
+_MATCHED_MASK = bytes(int(code & STATE_MASK == MATCHED and code & COLOR_MASK != 0) for code in range(256))
+_WITHOUT_MATCHED = bytes(0 if _MATCHED_MASK[code] else code for code in range(256))
+_RUN_OF_THREE = re.compile(rb"([\x01-\x08])\1\1+")
+
+
+def encode_cell(cell: str) -> int:
+    """
+    Returns the packed integer code of a single string cell such as "[S]" or " S ".
+    """
+    try:
+        return _ENCODE[cell]
+    except KeyError:
+        raise ValueError(f"{cell!r} is not a valid cell") from None
+
+
+def encode_cells(cells) -> bytearray:
+    """
+    Returns the packed integer codes of an iterable of string cells, in the same order.
+    """
+    try:
+        return bytearray(map(_ENCODE.__getitem__, cells))
+    except KeyError as error:
+        raise ValueError(f"{error.args[0]!r} is not a valid cell") from None
+
+
+def decode_cell(code: int) -> str:
+    """
+    Returns the string cell that the packed integer code stands for.
+    """
+    return _DECODE[code]
+
+
+def decode_cells(codes: bytes) -> [str]:
+    """
+    Returns the string cells that the packed integer codes stand for, in the same order.
+    """
+    return [_DECODE[code] for code in codes]
+
+
+def settle_column(codes: bytes) -> bytearray:
+    """
+    Returns the packed cells of one column with its matched jewels deleted and the rest of its cells
+    fallen to the bottom, in the same order.
+    """
+    jewels = codes.translate(_WITHOUT_MATCHED).replace(b"\x00", b"")
+    return bytearray(len(codes) - len(jewels)) + jewels
+
+
+def last_matched(codes: bytes) -> int:
+    """
+    Returns the index of the last jewel in the MATCHED state among the packed cells, or -1 if there is none.
+    """
+    return codes.translate(_MATCHED_MASK).rfind(1)
+
+
+def color_of(code: int) -> int:
+    """
+    Returns the jewel color (1 to 8, or 0 for an empty cell) of a packed cell.
+    """
+    return code & COLOR_MASK
+
+
+def state_of(code: int) -> int:
+    """
+    Returns the state (FROZEN, FALLING, LANDED or MATCHED) of a packed cell.
+    """
+    return code & STATE_MASK
+
+
+def find_matches(grid: "Grid") -> bytearray:
+    """
+    Returns a mask with the grid's layout that holds 1 for every frozen jewel that is part of a
+    horizontal, vertical or diagonal run of three or more jewels of the same color.
+
+    The frozen colors are copied into a buffer where every column is followed by an empty sentinel
+    cell, so stepping through it by 1, height + 1, height + 2 or height walks a vertical, horizontal,
+    diagonal or anti-diagonal line that stops at the edge of the board instead of wrapping around.
+    Each line is one byte slice, and its runs are found by a regular expression rather than cell by cell.
+    The cells are copied into and out of the buffer a column at a time, or a row at a time on grids
+    with more columns than rows, such as a batch of boards side by side.
+    """
+    height = grid.height
+    stride = height + 1
+    frozen = grid.cells.translate(_FROZEN_COLORS)
+    if grid.columns <= height:
+        padded = b"\x00".join(frozen[start:start + height] for start in range(0, len(frozen), height)) + b"\x00"
+    else:
+        padded = bytearray(grid.columns * stride)
+        for row in range(height):
+            padded[row::stride] = frozen[row::height]
+    padded_mask = bytearray(len(padded))
+
+    for step in (1, stride, stride + 1, stride - 1):
+        for start in range(step):
+            for run in _RUN_OF_THREE.finditer(padded[start::step]):
+                first, last = run.span()
+                padded_mask[start + first * step:start + last * step:step] = b"\x01" * (last - first)
+
+    if grid.columns <= height:
+        return bytearray(b"".join(padded_mask[start:start + height] for start in range(0, len(padded_mask), stride)))
+    mask = bytearray(len(frozen))
+    for row in range(height):
+        mask[row::height] = padded_mask[row::stride]
+    return mask
+
+
+def match_coordinates(grid: "Grid", mask: bytearray = None) -> [(int, int)]:
+    """
+    Returns the (column, row) coordinates of every matched jewel, in the same form as the coordinate
+    list that GameState used to build. The mask is computed with find_matches if it is not given.
+    """
+    if mask is None:
+        mask = find_matches(grid)
+
+    coordinates = []
+    index = mask.find(1)
+    while index != -1:
+        coordinates.append(divmod(index, grid.height))
+        index = mask.find(1, index + 1)
+
+    return coordinates
+
+
+class Grid:
+    def __init__(self, rows: int, columns: int, cells: bytearray = None) -> None:
+        """
+        Initializes a compact field of the given size. Every cell is packed into a single byte holding
+        the jewel color in the low bits and its state in the high bits. The cells are stored column by
+        column, top to bottom, including the three hidden rows above the visible field.
+        """
+        self.rows = rows
+        self.columns = columns
+        self.height = rows + 3
+        if cells is None:
+            cells = bytearray(columns * self.height)
+        elif len(cells) != columns * self.height:
+            raise ValueError(f"expected {columns * self.height} cells, got {len(cells)}")
+        self.cells = cells
+
+    @classmethod
+    def from_field(cls, field: [[str]]) -> "Grid":
+        """
+        Creates and returns a compact grid holding the same contents as the string field.
+        """
+        return cls(len(field[0]) - 3, len(field), encode_cells(chain.from_iterable(field)))
+
+    def to_field(self) -> [[str]]:
+        """
+        Creates and returns the string field that GameState and the visuals work with.
+        """
+        cells = self.cells
+        height = self.height
+        return [list(map(_DECODE.__getitem__, cells[start:start + height]))
+                for start in range(0, len(cells), height)]
+
+    def index(self, column: int, row: int) -> int:
+        """
+        Returns the position of the cell in the flat cell array.
+        """
+        return column * self.height + row
+
+    def get(self, column: int, row: int) -> int:
+        """
+        Returns the packed code of the cell.
+        """
+        return self.cells[column * self.height + row]
+
+    def set(self, column: int, row: int, code: int) -> None:
+        """
+        Stores the packed code in the cell.
+        """
+        self.cells[column * self.height + row] = code
+
+    def cell(self, column: int, row: int) -> str:
+        """
+        Returns the string form of the cell.
+        """
+        return _DECODE[self.cells[column * self.height + row]]
+
+    def column(self, column: int) -> bytearray:
+        """
+        Returns a copy of the packed cells of one column, top to bottom.
+        """
+        start = column * self.height
+        return self.cells[start:start + self.height]
+
+    def count_state(self, state: int) -> int:
+        """
+        Returns how many jewels on the grid are in the given state.
+        """
+        return sum(self.cells.count(state | color) for color in range(1, len(JEWELS) + 1))
+
+    def mark_matches(self, mask: bytearray) -> None:
+        """
+        Puts every jewel where the mask holds 1 into the MATCHED state.
+        """
+        size = len(self.cells)
+        marked = int.from_bytes(self.cells, "big") | int.from_bytes(mask, "big") * MATCHED
+        self.cells[:] = marked.to_bytes(size, "big")
+
+    def matched_mask(self) -> bytearray:
+        """
+        Returns a mask holding 1 for every jewel in the MATCHED state.
+        """
+        return self.cells.translate(_MATCHED_MASK)
+
+    def clear_matched(self) -> None:
+        """
+        Deletes every jewel in the MATCHED state.
+        """
+        self.cells[:] = self.cells.translate(_WITHOUT_MATCHED)
+
+    def apply_gravity(self) -> None:
+        """
+        Lets every jewel fall to the bottom of its column, keeping the order of the jewels in each column.
+        """
+        cells = self.cells
+        height = self.height
+        for start in range(0, len(cells), height):
+            column = cells[start:start + height]
+            jewels = column.replace(b"\x00", b"")
+            if len(jewels) != height and column[height - len(jewels):] != jewels:
+                cells[start:start + height] = bytes(height - len(jewels)) + jewels
+
+    def resolve_cascades(self) -> [bytearray]:
+        """
+        Marks and clears matches and lets the jewels fall again and again until no matches are left.
+        Returns the mask of jewels cleared by each step.
+        """
+        cleared_masks = []
+        while True:
+            self.mark_matches(find_matches(self))
+            cleared_mask = self.matched_mask()
+            if 1 not in cleared_mask:
+                return cleared_masks
+            self.clear_matched()
+            self.apply_gravity()
+            cleared_masks.append(cleared_mask)
+
+    def column_heights(self) -> [int]:
+        """
+        Returns how far each column is filled, from the bottom up to its topmost jewel.
+        """
+        cells = self.cells
+        height = self.height
+        return [len(cells[start:start + height].lstrip(b"\x00")) for start in range(0, len(cells), height)]
+
+    def copy(self) -> "Grid":
+        """
+        Returns an independent copy of the grid.
+        """
+        return Grid(self.rows, self.columns, bytearray(self.cells))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Grid):
+            return NotImplemented
+        return self.columns == other.columns and self.cells == other.cells
+
+    def __repr__(self) -> str:
+        return f"Grid(rows={self.rows}, columns={self.columns})"
@@ -0,0 +1,290 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+
+import columns_mechanics
+import columns_profiling
+import columns_replay
+import columns_rules
+import columns_search
+
+
+KEYS = ("LEFT", "RIGHT", "SPACE")
+
+
+class GameResult:
+    def __init__(self, seed: int, score: int, cascades: int, ticks: int, fallers: int, end_reason: str) -> None:
+        """
+        Initializes the outcome of one headless game: the number of cleared jewels (the score), the number
+        of clears, the number of ticks and fallers it took, and why the game stopped.
+        """
+        self.seed = seed
+        self.score = score
+        self.cascades = cascades
+        self.ticks = ticks
+        self.fallers = fallers
+        self.end_reason = end_reason
+
+    def as_dict(self) -> dict:
+        """
+        Returns the result as a dictionary that can be written out as JSON.
+        """
+        return {"seed": self.seed, "score": self.score, "cascades": self.cascades, "ticks": self.ticks,
+                "fallers": self.fallers, "end_reason": self.end_reason}
+
+    def __repr__(self) -> str:
+        return f"GameResult({self.as_dict()})"
+
+
+class HeadlessGame:
+    def __init__(self, rows: int = 13, columns: int = 6, seed: int = None, policy=None,
+                 fallers: [(int, [str])] = None, max_ticks: int = 100000, recorder=None) -> None:
+        """
+        Initializes a game without any rendering or timers. The fallers are generated from the seed the same
+        way Game does, unless a script of (column, jewels) fallers is given; a seed is picked at random if
+        none is given. After every drop the policy is called with this game and returns the keys ("LEFT",
+        "RIGHT" or "SPACE") to press for that faller. Every tick and key press is also passed on to the
+        recorder, a columns_replay.ReplayWriter, if one is given.
+        """
+        self.rows = rows
+        self.columns = columns
+        self.seed = seed if seed is not None else random.randrange(1 << 63)
+        self.rng = random.Random(self.seed)
+        self.policy_rng = random.Random(f"{self.seed}-policy")
+        self.recorder = recorder
+        self.policy = policy
+        self.faller_script = iter(fallers) if fallers is not None else None
+        self.max_ticks = max_ticks
+        self.game_state = columns_mechanics.GameState(rows, columns, "EMPTY", None)
+        self.game_state.add_listener(self._handle_game_state_event)
+        self.field = self.game_state.create_new_field()
+        self._ready_for_faller = True
+        self.column_faller = None
+        self.faller = None
+        self.ticks = 0
+        self.score = 0
+        self.cascades = 0
+        self.fallers = 0
+        self.end_reason = None
+
+    def play(self) -> GameResult:
+        """
+        Plays the game until it ends, drops a faller whenever the field is ready for one, and returns the result.
+        """
+        while self.end_reason is None:
+            if self.ready_for_faller():
+                if not self.spawn():
+                    break
+                if self.policy is not None:
+                    for key in self.policy(self):
+                        self.press(key)
+            self.tick()
+            if self.end_reason is None and self.ticks >= self.max_ticks:
+                self.end_reason = "tick_limit"
+
+        return self.result()
+
+    def ready_for_faller(self) -> bool:
+        """
+        Returns True once the board has settled after the last faller, so there is no faller and no
+        matched jewels left on the field.
+        """
+        return self._ready_for_faller
+
+    def spawn(self) -> bool:
+        """
+        Creates the next faller and drops it. Returns False and ends the game if there is no faller left in the
+        script or if the faller has no room to enter its column.
+        """
+        if self.faller_script is not None:
+            try:
+                self.column_faller, self.faller = next(self.faller_script)
+            except StopIteration:
+                self.end_reason = "script_exhausted"
+                return False
+        else:
+            self.column_faller, self.faller = columns_rules.next_faller(self.rng, self.columns)
+
+        try:
+            self.field = self.game_state.drop(self.field, self.column_faller - 1, self.faller)
+        except IndexError:
+            self.end_reason = "blocked"
+            return False
+
+        self._ready_for_faller = False
+        self.fallers += 1
+        return True
+
+    def press(self, key: str) -> None:
+        """
+        Applies a key press to the current faller.
+        """
+        if key == "LEFT":
+            self.field = self.game_state.move_left(self.field)
+        elif key == "RIGHT":
+            self.field = self.game_state.move_right(self.field)
+        elif key == "SPACE":
+            self.field = self.game_state.rotate(self.field)
+        else:
+            raise ValueError(f"unknown key {key!r}")
+
+        if self.recorder is not None:
+            self.recorder.key(key)
+
+    def tick(self) -> None:
+        """
+        Runs the same steps as a timer event in Game through columns_rules.run_tick and adds the cleared jewels to the score.
+        """
+        if self.recorder is not None:
+            self.recorder.tick()
+        self.ticks += 1
+        self.field, cleared_jewels = columns_rules.run_tick(self.game_state, self.field, self.rows)
+        if cleared_jewels:
+            self.score += cleared_jewels
+            self.cascades += 1
+
+    def snapshot(self) -> tuple:
+        """
+        Returns a checkpoint of the game: the snapshot of its game state, the states of its random number
+        generators and its counters.
+        """
+        return (self.game_state.snapshot(), self.rng.getstate(), self.policy_rng.getstate(),
+                (self.column_faller, list(self.faller) if self.faller is not None else None, self.ticks, self.score,
+                 self.cascades, self.fallers, self.end_reason, self._ready_for_faller))
+
+    def restore(self, snapshot: tuple) -> None:
+        """
+        Puts the game back into the state saved by snapshot.
+        """
+        game_state_snapshot, rng_state, policy_rng_state, counters = snapshot
+        self.field = self.game_state.restore(game_state_snapshot)
+        self.rng.setstate(rng_state)
+        self.policy_rng.setstate(policy_rng_state)
+        self.column_faller, faller, self.ticks, self.score, self.cascades, self.fallers, self.end_reason, \
+            self._ready_for_faller = counters
+        self.faller = list(faller) if faller is not None else None
+
+    def _handle_game_state_event(self, event: str) -> None:
+        """
+        Gets ready for a new faller once the board has settled and ends the game when it is over.
+        """
+        if event == columns_mechanics.CASCADE_FINISHED:
+            self._ready_for_faller = True
+        elif event == columns_mechanics.GAME_OVER:
+            self.end_reason = "game_over"
+
+    def result(self) -> GameResult:
+        """
+        Returns the result of the game so far.
+        """
+        return GameResult(self.seed, self.score, self.cascades, self.ticks, self.fallers, self.end_reason)
+
+
+def no_moves_policy(game: HeadlessGame) -> [str]:
+    """
+    Leaves every faller where it was dropped.
+    """
+    return []
+
+
+def random_policy(game: HeadlessGame) -> [str]:
+    """
+    Presses a few random keys for every faller.
+    """
+    return [game.policy_rng.choice(KEYS) for number in range(game.policy_rng.randint(0, 6))]
+
+
+def search_policy(game: HeadlessGame) -> [str]:
+    """
+    Presses the keys that move every faller to the placement that columns_search values most.
+    """
+    result = columns_search.search_faller(game.game_state, game.field)
+    if result.placement is None:
+        return []
+    return result.placement.keys
+
+
+POLICIES = {"none": no_moves_policy, "random": random_policy, "search": search_policy}
+
+
+def play_game(seed: int, rows: int = 13, columns: int = 6, policy=None, max_ticks: int = 100000,
+              record_directory: str = None) -> GameResult:
+    """
+    Plays one headless game with fallers generated from the seed and returns its result. If a record
+    directory is given, the game's replay log is written to it as <seed>.clrp.
+    """
+    if record_directory is None:
+        return HeadlessGame(rows, columns, seed, policy, max_ticks=max_ticks).play()
+
+    path = os.path.join(record_directory, f"{seed}.clrp")
+    with columns_replay.ReplayWriter(path, rows, columns, seed) as recorder:
+        return HeadlessGame(rows, columns, seed, policy, max_ticks=max_ticks, recorder=recorder).play()
+
+
+def _play_game_arguments(arguments: tuple) -> GameResult:
+    """
+    Unpacks the arguments sent to a worker process and plays the game.
+    """
+    return play_game(*arguments)
+
+
+def run_games(seeds, rows: int = 13, columns: int = 6, policy=None, max_ticks: int = 100000,
+              processes: int = None, chunksize: int = 64, record_directory: str = None):
+    """
+    Plays a game for every seed across a pool of worker processes and yields each result as soon as
+    it is finished, so the results arrive in no particular order. The policy has to be a module level
+    function so it can be sent to the workers. With one process the games are played in this process.
+    """
+    arguments = ((seed, rows, columns, policy, max_ticks, record_directory) for seed in seeds)
+    if processes == 1:
+        yield from map(_play_game_arguments, arguments)
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap_unordered(_play_game_arguments, arguments, chunksize)
+
+
+def main(argv: [str] = None) -> None:
+    """
+    Plays a batch of headless games and writes one JSON line per finished game.
+    """
+    parser = argparse.ArgumentParser(description="Play Columns games without a window.")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first game")
+    parser.add_argument("--rows", type=int, default=13)
+    parser.add_argument("--columns", type=int, default=6)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="random")
+    parser.add_argument("--max-ticks", type=int, default=100000)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--record", metavar="DIRECTORY", help="write a replay log of every game to this directory")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="time the GameState methods in this process and write the timings to this file "
+                             "(.prom for Prometheus, else JSON); implies --processes 1")
+    arguments = parser.parse_args(argv)
+
+    if arguments.record is not None:
+        os.makedirs(arguments.record, exist_ok=True)
+
+    profiler = None
+    processes = arguments.processes
+    if arguments.profile is not None:
+        profiler = columns_profiling.Profiler()
+        profiler.install_game_state()
+        processes = 1
+
+    seeds = range(arguments.seed, arguments.seed + arguments.games)
+    try:
+        for result in run_games(seeds, arguments.rows, arguments.columns, POLICIES[arguments.policy],
+                                arguments.max_ticks, processes, record_directory=arguments.record):
+            sys.stdout.write(json.dumps(result.as_dict()) + "\n")
+    finally:
+        if profiler is not None:
+            profiler.uninstall()
+            profiler.write(arguments.profile)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import mmap
+import os
+import struct
+
+import columns_grid
+
+
+BOARD_MAGIC = b"CLBD"
+BOARD_HEADER = struct.Struct("<4sIII")
+
+_INVALID = 0xFF
+_TEXT_CODES = bytes(columns_grid.encode_cell(f" {chr(byte)} ") if chr(byte) in columns_grid.JEWELS
+                    else columns_grid.EMPTY if byte == ord(" ") else _INVALID for byte in range(256))
+_BINARY_CODES = bytes(code if code == columns_grid.EMPTY or columns_grid.decode_cell(code) != "   " else _INVALID
+                      for code in range(256))
+
+
+def settle_rows(codes: bytes, columns: int, rows: int = None) -> columns_grid.Grid:
+    """
+    Returns a grid holding board rows that are given as packed cell codes, row by row from the top,
+    with every jewel fallen to the bottom of its column. The rows are placed at the bottom of a field
+    of the given number of rows (which defaults to the number of rows given) plus the three hidden
+    rows. Each column is cut out of the rows, stripped of its empty cells and padded at the top in a
+    single pass, so loading takes time linear in the size of the board.
+    """
+    if columns < 1 or len(codes) % columns:
+        raise ValueError(f"{len(codes)} cells do not make up rows of {columns} columns")
+    if rows is None:
+        rows = len(codes) // columns
+    height = rows + 3
+    if len(codes) // columns > height:
+        raise ValueError(f"{len(codes) // columns} rows do not fit into a field of {rows} rows")
+
+    cells = bytearray()
+    for column in range(columns):
+        jewels = codes[column::columns].replace(b"\x00", b"")
+        cells += bytes(height - len(jewels))
+        cells += jewels
+
+    return columns_grid.Grid(rows, columns, cells)
+
+
+def read_text_rows(lines, columns: int = None) -> (bytearray, int):
+    """
+    Reads the rows of a text board from an iterable of lines (strings or bytes, such as an open file)
+    and returns their packed cell codes row by row and the number of columns. Every line is one row
+    from the top, with one jewel letter or space per column; shorter lines are padded with spaces.
+    The number of columns defaults to the length of the longest line.
+    """
+    rows = []
+    width = 0
+    for line_number, line in enumerate(lines, 1):
+        if isinstance(line, str):
+            line = line.encode("ascii", "replace")
+        line = line.rstrip(b"\r\n")
+        codes = line.translate(_TEXT_CODES)
+        if _INVALID in codes:
+            raise ValueError(f"line {line_number} holds {chr(line[codes.index(_INVALID)])!r}, which is not a jewel")
+        rows.append(codes)
+        width = max(width, len(codes))
+
+    if columns is None:
+        columns = width
+    elif width > columns:
+        raise ValueError(f"a line is {width} cells wide, but the board has {columns} columns")
+
+    return bytearray(b"".join(codes.ljust(columns, b"\x00") for codes in rows)), columns
+
+
+def load_text(source, rows: int = None, columns: int = None) -> columns_grid.Grid:
+    """
+    Loads a text board into a settled grid. The source is the path of a text file, which is read
+    through a memory map, or an iterable of lines. The number of rows defaults to the number of lines
+    and the number of columns to the length of the longest line.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as board_file:
+            if os.fstat(board_file.fileno()).st_size == 0:
+                codes, columns = read_text_rows((), columns)
+            else:
+                with mmap.mmap(board_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    codes, columns = read_text_rows(iter(mapped.readline, b""), columns)
+    else:
+        codes, columns = read_text_rows(source, columns)
+
+    if not columns:
+        raise ValueError("the board has no columns")
+    return settle_rows(codes, columns, rows)
+
+
+def decode_board(data, rows: int = None) -> columns_grid.Grid:
+    """
+    Decodes a binary board into a settled grid. It starts with a header holding the magic bytes, the
+    number of rows of the field, the number of columns and the number of rows stored, followed by one
+    packed cell code per cell, row by row from the top. The number of rows defaults to the one in the header.
+    """
+    if len(data) < BOARD_HEADER.size:
+        raise ValueError("the board is too short to hold a header")
+    magic, field_rows, columns, stored_rows = BOARD_HEADER.unpack_from(data)
+    if magic != BOARD_MAGIC:
+        raise ValueError("the data is not a binary board")
+    if len(data) != BOARD_HEADER.size + columns * stored_rows:
+        raise ValueError(f"expected {columns * stored_rows} cells, got {len(data) - BOARD_HEADER.size}")
+
+    codes = bytes(memoryview(data)[BOARD_HEADER.size:])
+    if _INVALID in codes.translate(_BINARY_CODES):
+        raise ValueError("the board holds a byte that is not a valid cell")
+    return settle_rows(codes, columns, field_rows if rows is None else rows)
+
+
+def load_binary(path: str, rows: int = None) -> columns_grid.Grid:
+    """
+    Loads a binary board written by write_binary into a settled grid, reading it through a memory map.
+    """
+    with open(path, "rb") as board_file:
+        if os.fstat(board_file.fileno()).st_size == 0:
+            raise ValueError("the board is too short to hold a header")
+        with mmap.mmap(board_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decode_board(mapped, rows)
+
+
+def encode_board(grid: columns_grid.Grid) -> bytes:
+    """
+    Returns the binary board of a grid, holding every row of the grid including the hidden ones.
+    """
+    height = grid.height
+    rows = b"".join(grid.cells[row::height] for row in range(height))
+    return BOARD_HEADER.pack(BOARD_MAGIC, grid.rows, grid.columns, height) + rows
+
+
+def write_binary(path: str, grid: columns_grid.Grid) -> None:
+    """
+    Writes the binary board of a grid to a file.
+    """
+    with open(path, "wb") as board_file:
+        board_file.write(encode_board(grid))
+
+
+def load_board(path: str, rows: int = None, columns: int = None) -> columns_grid.Grid:
+    """
+    Loads a board file into a settled grid, as a binary board if it starts with the magic bytes and as
+    a text board otherwise. The number of columns is only used for text boards.
+    """
+    with open(path, "rb") as board_file:
+        is_binary = board_file.read(len(BOARD_MAGIC)) == BOARD_MAGIC
+    if is_binary:
+        return load_binary(path, rows)
+    return load_text(path, rows, columns)
@@ -1,52 +1,151 @@
-import copy
+import struct
+
+import columns_cache
+import columns_grid
+import columns_loader
+
+
+FALLER_FROZEN = "faller_frozen"
+CASCADE_FINISHED = "cascade_finished"
+GAME_OVER = "game_over"
+
+SNAPSHOT_MAGIC = b"CLSS"
+SNAPSHOT_HEADER = struct.Struct("<4sHHhhHBQ")
+_SNAPSHOT_LANDED = 0x01
+_SNAPSHOT_SETTLING = 0x02
+_SNAPSHOT_MATCHED = 0x04
+_SNAPSHOT_HASHED = 0x08
+
+
+def snapshot_size(rows: int, columns: int) -> int:
+    """
+    Returns the size in bytes of a snapshot of a game state with the given number of rows and columns.
+    """
+    return SNAPSHOT_HEADER.size + columns * (rows + 3)
+
+
+class Faller:
+    def __init__(self, column: int, top: int, jewels: [str], landed: bool = False) -> None:
+        """
+        Initializes the faller's column, the row of its top jewel, its jewels from top to bottom
+        and whether it has landed.
+        """
+        self.column = column
+        self.top = top
+        self.jewels = jewels
+        self.landed = landed
+
+    @property
+    def bottom(self) -> int:
+        """
+        Returns the row of the faller's bottom jewel.
+        """
+        return self.top + len(self.jewels) - 1
+
+    def cells(self) -> [str]:
+        """
+        Returns the faller's cells from top to bottom, in bars if it has landed and in brackets otherwise.
+        """
+        if self.landed:
+            return [f"|{jewel}|" for jewel in self.jewels]
+        return [f"[{jewel}]" for jewel in self.jewels]
+
+    def __repr__(self) -> str:
+        return f"Faller(column={self.column}, top={self.top}, jewels={self.jewels}, landed={self.landed})"
 
 
 class GameState:
-    def __init__(self, rows: int, columns: int, initial_format: str, field_contents: [[str]]) -> None:
+    def __init__(self, rows: int, columns: int, initial_format: str, field_contents: [[str]],
+                 resolution_cache: columns_cache.ResolutionCache = None) -> None:
         """
         Initializes all of the data such as the inputted rows, columns, format, and field contents.
-        This also initializes the field as well as the field before it was edited by a move. It also
-        creates lists for all of the possible jewel conditions such as having brackets, bars, or asterisks.
+        This also initializes the field, the current faller and the indexes kept up to date on every move.
         """
         self.rows = rows
         self.columns = columns
         self.initial_format = initial_format
         self.field_contents = field_contents
         self.field = []
+        self.faller = None
         self.list_possible_jewels_asterisks = [f"*{chr(i)}*" for i in range(83, 91)]
-        self._previous_field = []
-        self._list_possible_jewels_brackets = [f"[{chr(i)}]" for i in range(83, 91)]
-        self._list_possible_jewels_lines = [f"|{chr(i)}|" for i in range(83, 91)]
+        self._dirty_cells = None
+        self._column_heights = [0] * columns
+        self._matched_cells = set()
+        self._board_hash = None
+        self.resolution_cache = resolution_cache
+        self._listeners = []
+        self._settling = False
+
+    def add_listener(self, listener) -> None:
+        """
+        Registers a function that is called with FALLER_FROZEN when a faller freezes, with CASCADE_FINISHED
+        when a freeze or a clear has been followed by a matching that left no faller and no matched jewels
+        on the board, and with GAME_OVER when check_end_game finds that the game has ended.
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener) -> None:
+        """
+        Stops calling a function registered with add_listener.
+        """
+        self._listeners.remove(listener)
 
     def create_new_field(self) -> [[str]]:
         """
         Creates and returns the field based off of the user input of EMPTY or CONTENTS.
         """
+        self.faller = None
+        self._settling = False
         if self.initial_format == "EMPTY":
             game_field = self._create_blank_field(self.rows, self.columns)
+            self._dirty_cells = set()
         elif self.initial_format == "CONTENTS":
-            blank_field = self._create_blank_field(self.rows, self.columns)
-            game_field = self._create_contents_field(blank_field, self.field_contents)
+            return self.load_grid(self._create_contents_grid(self.field_contents))
+        self._index_field(game_field)
+        self._board_hash = None
 
         return game_field
 
-    def drop(self, field: [[str]], column_selection: int, faller_list: [str]) -> [[str]]:
+    def load_grid(self, grid: columns_grid.Grid) -> [[str]]:
         """
-        Drops the faller into the selected column and returns the updated board.
+        Makes a field holding the contents of the grid, such as a board read by columns_loader, the
+        field this game state updates from then on, and returns it. Any jewels in brackets or bars
+        become the faller, and the whole field is matched on the next call to matching.
         """
+        if (grid.rows, grid.columns) != (self.rows, self.columns):
+            raise ValueError(f"cannot load a {grid.rows}x{grid.columns} grid into a {self.rows}x{self.columns} game")
 
-        if field[column_selection][3] != "   ":
-            for index in range(len(faller_list)):
-                if field[column_selection][index] == "   ":
-                    field[column_selection][index] = f"[{faller_list[index]}]"
+        field = grid.to_field()
+        if grid.count_state(columns_grid.FALLING) or grid.count_state(columns_grid.LANDED):
+            self.faller = self._find_faller(field)
+            self._index_field(field)
         else:
-            for index in range(len(faller_list)):
-                if field[column_selection][index + 1] == "   ":
-                    field[column_selection][index + 1] = f"[{faller_list[index]}]"
+            self.faller = None
+            self._column_heights = grid.column_heights()
+            self._matched_cells = set(columns_grid.match_coordinates(grid, grid.matched_mask()))
+        self._settling = False
+        self._dirty_cells = None
+        self._board_hash = None
+        self.field = field
+        return field
 
-        last_jewel_index = self._find_last_jewel_index(field[column_selection])
+    def drop(self, field: [[str]], column_selection: int, faller_list: [str]) -> [[str]]:
+        """
+        Drops the faller into the selected column and returns the updated board. The faller enters
+        just above the visible field, or at the very top if the top visible row is already taken.
+        """
+        self._track(field)
+        stack_top = self._stack_top(field, column_selection)
+        first_row = 0 if stack_top <= 3 else 1
+        faller_rows = range(first_row, min(first_row + len(faller_list), stack_top))
+        if not faller_rows:
+            raise IndexError(f"there is no room for a faller in column {column_selection}")
 
-        if field[column_selection][last_jewel_index + 1] != "   ":
+        self.faller = Faller(column_selection, faller_rows[0],
+                             [faller_list[row - first_row] for row in faller_rows])
+        self._write_faller(field)
+
+        if self._faller_supported(field):
             self._landed_no_brackets(field)
 
         self.field = field
@@ -56,17 +155,10 @@ class GameState:
         """
         Rotates the current faller and returns the updated board.
         """
-        for column_index, column in enumerate(field):
-            if any(cell in column for cell in self._list_possible_jewels_brackets) \
-                    or any(cell in column for cell in self._list_possible_jewels_lines):
-                jewels_in_column = self._make_jewel_list(column)
-                jewels_in_column_rotated = [jewels_in_column[-1]] + jewels_in_column[:-1]
-
-                jewel_index = 0
-                for index_cell, cell in enumerate(column):
-                    if cell != "   " and cell.count(" ") != 2:
-                        field[column_index][index_cell] = jewels_in_column_rotated[jewel_index]
-                        jewel_index += 1
+        self._track(field)
+        if self.faller is not None:
+            self.faller.jewels = [self.faller.jewels[-1]] + self.faller.jewels[:-1]
+            self._write_faller(field)
 
         self.field = field
         return self.field
@@ -74,56 +166,38 @@ class GameState:
     def move_left(self, field: [[str]]) -> [[str]]:
         """
         Moves the faller to the left if it is possible and returns the updated board.
+        The faller is in bars in its new column if there is anything below it.
         """
-        for column_index, column in enumerate(field):
-            if any(cell in column for cell in self._list_possible_jewels_brackets) \
-                    or any(cell in column for cell in self._list_possible_jewels_lines):
-
-                last_jewel_index = self._find_last_jewel_index(column)
-                if column_index != 0:
-                    for cell_index, cell in enumerate(column):
-
-                        if cell.count(" ") == 0 and field[column_index - 1][last_jewel_index] == "   ":
-                            field[column_index - 1][cell_index] = cell
-                            field[column_index][cell_index] = "   "
-                            try:
-                                if field[column_index - 1][last_jewel_index + 1] == "   ":
-                                    field[column_index - 1][cell_index] = "[" + cell[1] + "]"
-
-                                else:
-                                    field[column_index - 1][cell_index] = "|" + cell[1] + "|"
-                            except IndexError:
-                                pass
+        self._track(field)
+        faller = self.faller
+        if faller is not None and faller.column != 0 and faller.bottom < self._stack_top(field, faller.column - 1):
+            self._erase_faller(field)
+            faller.column -= 1
+            if faller.bottom + 1 < len(field[faller.column]):
+                faller.landed = self._faller_supported(field)
+            self._write_faller(field)
 
         self.field = field
         return self.field
 
-    def move_right(self, field):
+    def move_right(self, field: [[str]]) -> [[str]]:
         """
         Moves the faller to the right if it is possible and returns the updated board.
-        """
-        duplicated_field = copy.deepcopy(field)
-        for column_index, column in enumerate(duplicated_field):
-
-            if any(cell in column for cell in self._list_possible_jewels_brackets) \
-                    or any(cell in column for cell in self._list_possible_jewels_lines):
-
-                last_jewel_index = self._find_last_jewel_index(column)
-
-                if column_index != field.index(field[-1]) and field[column_index + 1][last_jewel_index] == "   ":
-                    for cell_index, cell in enumerate(column):
-
-                        if cell.count(" ") == 0:
-                            field[column_index + 1][cell_index] = cell
-                            field[column_index][cell_index] = "   "
-
-                            try:
-                                if field[column_index + 1][last_jewel_index + 1] == "   ":
-                                    field[column_index + 1][cell_index] = "[" + cell[1] + "]"
-                                elif field[column_index + 1][last_jewel_index + 1].count(" ") == 2:
-                                    field[column_index + 1][cell_index] = "|" + cell[1] + "|"
-                            except IndexError:
-                                pass
+        The faller is in bars in its new column only if there is a frozen jewel below it; if there is
+        something else below it, it keeps its brackets or bars.
+        """
+        self._track(field)
+        faller = self.faller
+        if faller is not None and faller.column != len(field) - 1 \
+                and faller.bottom < self._stack_top(field, faller.column + 1):
+            self._erase_faller(field)
+            faller.column += 1
+            if faller.bottom + 1 < len(field[faller.column]):
+                if not self._faller_supported(field):
+                    faller.landed = False
+                elif field[faller.column][faller.bottom + 1].count(" ") == 2:
+                    faller.landed = True
+            self._write_faller(field)
 
         self.field = field
         return self.field
@@ -132,92 +206,201 @@ class GameState:
         """
         Causes the faller to fall one row down. If it lands on another jewel or if it hits the bottom,
         bars will replace the brackets. If the user wants to freeze the jewels, the bars disappear after
-        the next input that causes the faller to fall when it has already landed.
+        the next input that causes the faller to fall when it has already landed, which is the
+        case when there was no falling faller to move.
         """
-        self._previous_field = field[:]
-        for column_index, column in enumerate(field):
-            if any(cell in column for cell in self._list_possible_jewels_brackets):
-                falling_jewels_and_blanks = column[:]
-                frozen_jewels = []
-                for cell in column:
-                    if cell.count(" ") == 2:
-                        falling_jewels_and_blanks.remove(cell)
-                        frozen_jewels.append(cell)
-
-                field[column_index] = [falling_jewels_and_blanks[-1]] + falling_jewels_and_blanks[:-1] + frozen_jewels
-                last_jewel_index = self._find_last_jewel_index(field[column_index])
-                if last_jewel_index == self.rows + 2:
-                    self._landed_no_brackets(field)
-
-                try:
-                    if field[column_index][last_jewel_index + 1] != "   ":
-                        self._landed_no_brackets(field)
-
-                except IndexError:
-                    pass
-
-        if self._previous_field == field:
+        self._track(field)
+        faller = self.faller
+        if faller is None or faller.landed:
             self._freeze(field)
+        elif self._faller_supported(field):
+            self._landed_no_brackets(field)
+        else:
+            self._set_cell(field, faller.column, faller.top, "   ")
+            faller.top += 1
+            self._write_faller(field)
+            if self._faller_supported(field):
+                self._landed_no_brackets(field)
 
         self.field = field
         return self.field
 
-    def matching(self, field: [[str]]) -> [[str]]:
+    def matching(self, field: [[str]], full_scan: bool = False) -> [[str]]:
         """
-        Based off the three private functions that check for matching across the entire board,
-        this causes every matched jewel to be surrounded by asterisks and returns the updated board.
+        Surrounds every jewel that is part of a run of three or more matching frozen jewels with
+        asterisks and returns the updated board. Only the lines through the cells frozen or moved
+        since the last call (the dirty cells) are examined, unless the field has been replaced or
+        changed behind the game state's back, which sets the dirty cells to None, or full_scan is set.
         """
-        all_matches_coordinates = self._horizontal_matching(field) + self._vertical_matching(field) + \
-                                  self._diagonal_matching(field)
+        self._track(field)
+        if full_scan or self._dirty_cells is None:
+            grid = columns_grid.Grid.from_field(field)
+            all_matches = columns_grid.match_coordinates(grid)
+        else:
+            all_matches = self._dirty_matching(field, self._dirty_cells)
 
-        all_matches = set(all_matches_coordinates)
-        for coordinate_pair in all_matches:
-            field[coordinate_pair[0]][coordinate_pair[1]] = f"*{field[coordinate_pair[0]][coordinate_pair[1]][1]}*"
+        for column_index, cell_index in all_matches:
+            self._set_cell(field, column_index, cell_index, f"*{field[column_index][cell_index][1]}*")
+        self._matched_cells.update(all_matches)
 
+        self._dirty_cells = set()
         self.field = field
+        self._check_settled(field)
         return self.field
 
     def clear(self, field: [[str]]) -> [[str]]:
         """
         Clears the field of any matched jewels, causes the rest of the frozen jewels to
-        automatically fall to the bottom, and returns the updated field.
-        """
-        cleared_matches_field = self._deleting_matches(field)
-        fallen_jewels_field = self._automatic_fall(cleared_matches_field)
+        automatically fall to the bottom, and returns the updated field. Only the columns holding
+        matched jewels or the faller are compacted, each on its packed cells, unless most of the board
+        is matched, in which case every column is compacted rather than collecting the columns from
+        the matched cells.
+        """
+        self._track(field)
+        if len(self._matched_cells) * 2 > len(field) * len(field[0]):
+            cleared_columns = set(range(len(field)))
+        else:
+            cleared_columns = {column_index for column_index, cell_index in self._matched_cells}
+        if self.faller is not None:
+            cleared_columns.add(self.faller.column)
+        for column_index in sorted(cleared_columns):
+            self._compact_column(field, column_index)
+        self._matched_cells = set()
+        self._settling = True
 
-        self.field = fallen_jewels_field
+        self.field = field
         return self.field
 
+    def resolve_cascades(self, field: [[str]]) -> [bytearray]:
+        """
+        Marks and clears matches and lets the jewels fall again and again until no matches are left,
+        all in one call on a compact grid instead of one clear per timer tick. The field is updated
+        in place. Returns the mask of jewels cleared by each step (1 for every cleared jewel, indexed
+        by column * (rows + 3) + row) so that the steps can still be animated. If the board has been
+        resolved before and is still in the resolution cache, which is looked up by the board hash and
+        checked against the stored cells of the board, the stored result is used instead.
+        """
+        self._track(field)
+        grid = columns_grid.Grid.from_field(field)
+        initial_cells = bytes(grid.cells)
+        if self._board_hash is None:
+            self._board_hash = columns_cache.cells_hash(initial_cells)
+        key = (len(field), len(field[0]), self._board_hash)
+        entry = self.resolution_cache.get(key, initial_cells) if self.resolution_cache is not None else None
+        if entry is not None:
+            initial_cells, resolved_cells, resolved_hash, cleared_masks = entry
+            grid.cells[:] = resolved_cells
+            cleared_masks = [bytearray(cleared_mask) for cleared_mask in cleared_masks]
+        else:
+            cleared_masks = grid.resolve_cascades()
+            resolved_hash = columns_cache.rehash(self._board_hash, initial_cells, grid.cells)
+            if self.resolution_cache is not None:
+                self.resolution_cache.put(key, (initial_cells, bytes(grid.cells), resolved_hash,
+                                                tuple(bytes(cleared_mask) for cleared_mask in cleared_masks)))
+
+        if cleared_masks:
+            field[:] = grid.to_field()
+            if self.faller is not None:
+                self.faller = self._find_faller(field)
+            self._index_field(field)
+            self._board_hash = resolved_hash
+            self._settling = True
+
+        self._dirty_cells = set()
+        self.field = field
+        self._check_settled(field)
+        return cleared_masks
+
+    def board_hash(self, field: [[str]]) -> int:
+        """
+        Returns the Zobrist hash of the field. Equal boards of the same size have equal hashes. The hash
+        is only computed when it is asked for after the field has changed, and then kept until the next change.
+        """
+        self._track(field)
+        if self._board_hash is None:
+            self._board_hash = columns_cache.cells_hash(columns_grid.Grid.from_field(field).cells)
+        return self._board_hash
+
     def checking_for_asterisks(self, field) -> bool:
         """
         Checks the field for any asterisks. This is used to help trigger the clear function to clear the board.
         If there are no asterisks, then matching has finished, and the board should only have frozen jewels.
         """
-        asterisks_present = False
-        for column_index, column in enumerate(field):
-            if any(cell in column for cell in self.list_possible_jewels_asterisks):
-                asterisks_present = True
-
-        return asterisks_present
+        self._track(field)
+        return bool(self._matched_cells)
 
     def check_end_game(self, end_field: [[str]], rows: int) -> bool:
         """
-        Checks if the game is over. If there are no asterisks in any column and if the length of any
-        of the columns is greater than the field rows, then it ends the game.
-        """
-        asterisk_counter = 0
-        length_counter = 0
+        Checks if the game is over. If there are no asterisks in any column and if the stack of frozen
+        jewels in any of the columns is higher than the field rows, then it ends the game.
+        """
+        self._track(end_field)
+        game_over = not self._matched_cells and max(self._column_heights, default=0) > rows
+        if game_over:
+            self._notify(GAME_OVER)
+        return game_over
+
+    def snapshot(self) -> bytes:
+        """
+        Returns the state of the field this game state has been updating as one contiguous buffer.
+        A header holds the size of the field, the faller's column (-1 if there is no faller), top row,
+        length and whether it has landed, whether the board is settling, whether it has been matched
+        since the last change, and the board hash if it has been computed since the last change. It is
+        followed by one packed byte per cell, column by column, so every snapshot of a field of the same
+        size has the same length.
+        """
+        field = self.field
+        faller = self.faller
+        flags = 0
+        if faller is not None and faller.landed:
+            flags |= _SNAPSHOT_LANDED
+        if self._settling:
+            flags |= _SNAPSHOT_SETTLING
+        if self._dirty_cells is not None and not self._dirty_cells:
+            flags |= _SNAPSHOT_MATCHED
+        if self._board_hash is not None:
+            flags |= _SNAPSHOT_HASHED
+
+        header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(field[0]) - 3, len(field),
+                                      faller.column if faller is not None else -1,
+                                      faller.top if faller is not None else 0,
+                                      len(faller.jewels) if faller is not None else 0, flags, self._board_hash or 0)
+        return header + columns_grid.Grid.from_field(field).cells
+
+    def restore(self, snapshot) -> [[str]]:
+        """
+        Restores the state saved by snapshot from a bytes-like object such as bytes or a memoryview, and
+        returns the restored field, which this game state updates from then on. The cells are decoded
+        straight into the shared cell strings and the faller, column heights, matched cells and board
+        hash are read from the snapshot instead of being searched for.
+        """
+        magic, rows, columns, faller_column, faller_top, faller_size, flags, board_hash = \
+            SNAPSHOT_HEADER.unpack_from(snapshot)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError("the buffer is not a game state snapshot")
+        if len(snapshot) != snapshot_size(rows, columns):
+            raise ValueError(f"expected a snapshot of {snapshot_size(rows, columns)} bytes, got {len(snapshot)}")
+        if (rows, columns) != (self.rows, self.columns):
+            raise ValueError(f"cannot restore a {rows}x{columns} snapshot into a {self.rows}x{self.columns} game")
+
+        grid = columns_grid.Grid(rows, columns, bytearray(memoryview(snapshot)[SNAPSHOT_HEADER.size:]))
+        field = grid.to_field()
+        self._column_heights = grid.column_heights()
+        if faller_column >= 0:
+            self.faller = Faller(faller_column, faller_top,
+                                 [field[faller_column][row][1] for row in range(faller_top, faller_top + faller_size)],
+                                 bool(flags & _SNAPSHOT_LANDED))
+            below_faller = grid.column(faller_column)[self.faller.bottom + 1:]
+            self._column_heights[faller_column] = len(below_faller.lstrip(b"\x00"))
+        else:
+            self.faller = None
 
-        for column in end_field:
-            frozen_jewels = []
-            if any(cell in column for cell in self.list_possible_jewels_asterisks):
-                asterisk_counter += 1
-            for cell in column:
-                if cell.count(" ") == 2:
-                    frozen_jewels.append(cell)
-            if len(frozen_jewels) > rows:
-                length_counter += 1
-        return asterisk_counter == 0 and length_counter != 0
+        self._matched_cells = set(columns_grid.match_coordinates(grid, grid.matched_mask()))
+        self._dirty_cells = set() if flags & _SNAPSHOT_MATCHED else None
+        self._settling = bool(flags & _SNAPSHOT_SETTLING)
+        self._board_hash = board_hash if flags & _SNAPSHOT_HASHED else None
+        self.field = field
+        return field
 
     def _create_blank_field(self, rows: int, columns: int) -> [[str]]:
         """
@@ -231,50 +414,22 @@ class GameState:
         self.field = field
         return self.field
 
-    def _create_contents_field(self, field: [[str]], field_contents: [[str]]) -> [[str]]:
+    def _create_contents_grid(self, field_contents: [[str]]) -> columns_grid.Grid:
         """
-        Creates and returns a field with contents based off of the user inputs.
+        Creates and returns a grid with contents based off of the user inputs. The rows of contents
+        are placed at the bottom of the field, and the jewels fall to the bottom of their columns.
         """
-        blank_field_copy = field[:]
-        jewel_index = 0
-        for column_index, column in enumerate(blank_field_copy):
-
-            for line_of_content in field_contents:
-                field[column_index].append(line_of_content[jewel_index])
-                field[column_index].pop(0)
-
-            jewel_index += 1
-
-        field = self._automatic_fall(field)
-        self.field = field
-        return self.field
-
-    def _make_jewel_list(self, column_containing_faller: [str]) -> [str]:
-        """
-        Returns the list of jewels of the current faller.
-        """
-        faller_jewels = [cell for cell in column_containing_faller if cell.count(" ") == 0]
-        return faller_jewels
-
-    def _find_last_jewel_index(self, faller_column: [str]) -> int:
-        """
-        Returns the last faller jewel index in its respective column.
-        """
-        jewels_in_column = self._make_jewel_list(faller_column)
-        last_jewel = jewels_in_column[-1]
-        last_jewel_index = int((''.join(faller_column).rindex(last_jewel)) / 3)
-
-        return last_jewel_index
+        field_contents = field_contents[-(self.rows + 3):]
+        codes = columns_grid.encode_cells(cell for line_of_content in field_contents
+                                          for cell in line_of_content[:self.columns])
+        return columns_loader.settle_rows(codes, self.columns, self.rows)
 
     def _landed_no_brackets(self, field: [[str]]) -> [[str]]:
         """
-        Changes all of the brackets to bars if the faller has landed and returns the updated board.
+        Changes the brackets of the faller to bars once it has landed and returns the updated board.
         """
-        translation = str.maketrans("[]", "||")
-        for column_index, column in enumerate(field):
-            if any(cell in column for cell in self._list_possible_jewels_brackets):
-                for index_cell, cell in enumerate(column):
-                    field[column_index][index_cell] = cell.translate(translation)
+        self.faller.landed = True
+        self._write_faller(field)
 
         self.field = field
         return self.field
@@ -282,108 +437,172 @@ class GameState:
     def _freeze(self, field: [[str]]) -> [[str]]:
         """
         Changes the bars to empty spaces if the jewels have been frozen and returns the updated board.
-        """
-        translation = str.maketrans("|", " ")
-        for column_index, column in enumerate(field):
-            if any(cell in column for cell in self._list_possible_jewels_lines):
-                for index_cell, cell in enumerate(column):
-                    field[column_index][index_cell] = field[column_index][index_cell].translate(translation)
+        The frozen jewels are no longer a faller.
+        """
+        faller = self.faller
+        if faller is not None and faller.landed:
+            for cell_index, jewel in enumerate(faller.jewels, faller.top):
+                self._set_cell(field, faller.column, cell_index, f" {jewel} ")
+                if self._dirty_cells is not None:
+                    self._dirty_cells.add((faller.column, cell_index))
+            self._column_heights[faller.column] = max(self._column_heights[faller.column],
+                                                      len(field[faller.column]) - faller.top)
+            self.faller = None
+            self._settling = True
+            self._notify(FALLER_FROZEN)
 
         self.field = field
         return self.field
 
-    def _automatic_fall(self, field: [[str]]) -> [[str]]:
+    def _compact_column(self, field: [[str]], column_index: int) -> None:
+        """
+        Deletes the matched jewels of a column and lets the rest fall to the bottom on the packed cells of
+        the column, and writes the column back only if it changed. The faller, if it is in the column, ends
+        up on top of the stack. Nothing below the lowest matched jewel or the bottom of the faller moves, so
+        only the frozen jewels above it that are not where they were before are added to the dirty cells.
+        """
+        previous_cells = columns_grid.encode_cells(field[column_index])
+        cells = columns_grid.settle_column(previous_cells)
+        height = len(cells) - cells.count(columns_grid.EMPTY)
+        lowest_row = columns_grid.last_matched(previous_cells)
+        faller = self.faller
+        if faller is not None and faller.column == column_index:
+            lowest_row = max(lowest_row, faller.bottom)
+            faller.top = len(cells) - height
+            height -= len(faller.jewels)
+        self._column_heights[column_index] = height
+        if cells == previous_cells:
+            return
+
+        self._replace_column(field, column_index, columns_grid.decode_cells(cells))
+        if self._dirty_cells is not None:
+            self._dirty_cells.update((column_index, cell_index)
+                                     for cell_index in range(len(cells) - height, lowest_row + 1)
+                                     if cells[cell_index] != previous_cells[cell_index]
+                                     and 0 < cells[cell_index] <= len(columns_grid.JEWELS))
+
+    def _dirty_matching(self, field: [[str]], dirty_cells: {(int, int)}) -> {(int, int)}:
+        """
+        Returns the coordinates of every jewel in a run of three or more matching frozen jewels
+        that passes through one of the dirty cells.
+        """
+        matched_jewels = set()
+        for column_index, cell_index in dirty_cells:
+            cell = field[column_index][cell_index]
+            if cell.count(" ") != 2:
+                continue
+
+            for column_step, cell_step in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                run = [(column_index, cell_index)]
+                for direction in (1, -1):
+                    next_column = column_index + column_step * direction
+                    next_cell = cell_index + cell_step * direction
+                    while 0 <= next_column < len(field) and 0 <= next_cell < len(field[next_column]) \
+                            and field[next_column][next_cell] == cell:
+                        run.append((next_column, next_cell))
+                        next_column += column_step * direction
+                        next_cell += cell_step * direction
+
+                if len(run) >= 3:
+                    matched_jewels.update(run)
+
+        return matched_jewels
+
+    def _write_faller(self, field: [[str]]) -> None:
         """
-        If there are floating jewels after the user has implemented contents onto the board or if
-        matched jewels are cleared, all remaining jewels fall to the bottom and the updated board is returned.
+        Writes the faller's cells into its column.
         """
-        copy_field = field[:]
-        for column_index, column in enumerate(copy_field):
-            reversed_column = column[::-1]
-            column_copy = column[:]
-            for cell_index, cell in enumerate(reversed(column_copy)):
-                if cell == "   ":
-                    reversed_column.remove(cell)
-                    reversed_column.append(cell)
+        faller = self.faller
+        for cell_index, cell in enumerate(faller.cells(), faller.top):
+            self._set_cell(field, faller.column, cell_index, cell)
 
-            field[column_index] = reversed_column[::-1]
+    def _erase_faller(self, field: [[str]]) -> None:
+        """
+        Replaces the faller's cells with empty spaces.
+        """
+        faller = self.faller
+        for cell_index in range(faller.top, faller.bottom + 1):
+            self._set_cell(field, faller.column, cell_index, "   ")
 
-        self.field = field
-        return self.field
+    def _set_cell(self, field: [[str]], column_index: int, cell_index: int, cell: str) -> None:
+        """
+        Writes one cell of the field and forgets the board hash. Every change to a tracked field goes
+        through this method or _replace_column so that a stale hash is never returned.
+        """
+        field[column_index][cell_index] = cell
+        self._board_hash = None
 
-    def _horizontal_matching(self, field: [[str]]) -> [tuple]:
+    def _replace_column(self, field: [[str]], column_index: int, cells: [str]) -> None:
         """
-        Returns the coordinates of every horizontally matched jewel in the field.
+        Replaces a whole column of the field and forgets the board hash.
         """
-        matched_jewels = []
-        for column_index, column in enumerate(field):
-            for cell_index, cell in enumerate(column):
-                if cell.count(" ") == 2:
-                    try:
-                        if cell == field[column_index + 1][cell_index] == field[column_index + 2][cell_index]:
-                            matched_jewels.extend(((column_index, cell_index),
-                                                   (column_index + 1, cell_index),
-                                                   (column_index + 2, cell_index)))
+        field[column_index] = cells
+        self._board_hash = None
 
-                    except IndexError:
-                        pass
+    def _stack_top(self, field: [[str]], column_index: int) -> int:
+        """
+        Returns the row of the topmost jewel in the column that is not part of the faller, or the
+        number of cells in the column if it holds no such jewel.
+        """
+        return len(field[column_index]) - self._column_heights[column_index]
 
-        return matched_jewels
+    def _faller_supported(self, field: [[str]]) -> bool:
+        """
+        Returns True if the faller is on the bottom row or right above the stack of jewels in its column.
+        """
+        return self.faller.bottom + 1 >= self._stack_top(field, self.faller.column)
 
-    def _vertical_matching(self, field: [[str]]) -> [tuple]:
+    def _find_faller(self, field: [[str]]) -> Faller:
         """
-        Returns the coordinates of every vertically matched jewel in the field.
+        Finds the faller in a field by looking for bracketed or barred cells and returns it,
+        or None if there is no faller.
         """
-        matched_jewels = []
         for column_index, column in enumerate(field):
-            for cell_index, cell in enumerate(column):
-                if cell.count(" ") == 2:
-                    try:
-                        if cell == field[column_index][cell_index + 1] == field[column_index][cell_index + 2]:
-                            matched_jewels.extend(((column_index, cell_index),
-                                                   (column_index, cell_index + 1),
-                                                   (column_index, cell_index + 2)))
-                    except IndexError:
-                        pass
+            faller_rows = [cell_index for cell_index, cell in enumerate(column) if cell[0] in "[|"]
+            if faller_rows:
+                return Faller(column_index, faller_rows[0], [column[row][1] for row in faller_rows],
+                              column[faller_rows[0]][0] == "|")
 
-        return matched_jewels
+        return None
 
-    def _diagonal_matching(self, field: [[str]]) -> [tuple]:
+    def _check_settled(self, field: [[str]]) -> None:
         """
-        Returns the coordinates of every diagonally matched jewel in the field.
+        Tells the listeners that the cascade has finished once a freeze or a clear has left no faller
+        and no matched jewels on the board.
         """
-        matched_jewels = []
-        for column_index, column in enumerate(field):
-            for cell_index, cell in enumerate(column):
-                if cell.count(" ") == 2:
-
-                    try:
-                        if cell == field[column_index + 1][cell_index + 1] == field[column_index + 2][cell_index + 2]:
-                            matched_jewels.extend(((column_index, cell_index),
-                                                   (column_index + 1, cell_index + 1),
-                                                   (column_index + 2, cell_index + 2)))
-                    except IndexError:
-                        pass
-
-                    try:
-                        if cell == field[column_index + 1][cell_index - 1] == field[column_index + 2][cell_index - 2]:
-                            matched_jewels.extend(((column_index, cell_index),
-                                                   (column_index + 1, cell_index - 1),
-                                                   (column_index + 2, cell_index - 2)))
-                    except IndexError:
-                        pass
-
-        return matched_jewels
+        if self._settling and self.faller is None and not self.checking_for_asterisks(field):
+            self._settling = False
+            self._notify(CASCADE_FINISHED)
 
-    def _deleting_matches(self, field: [[str]]) -> [[str]]:
+    def _notify(self, event: str) -> None:
         """
-        Deletes all of the matched jewels and returns the updated board.
+        Calls every registered listener with the event.
         """
-        field_copy = field[:]
-        for column_index, column in enumerate(field_copy):
-            for cell_index, cell in enumerate(column):
-                if cell.count("*") == 2:
-                    field[column_index][cell_index] = "   "
+        for listener in self._listeners:
+            listener(event)
 
-        self.field = field
-        return self.field
+    def _index_field(self, field: [[str]]) -> None:
+        """
+        Measures the column heights and collects the matched cells by scanning the whole field. The column
+        heights hold how far the stack of jewels that are not part of the faller reaches up from the bottom
+        of each column, so that landing and the end of the game can be checked without scanning the field.
+        """
+        self._column_heights = []
+        self._matched_cells = set()
+        for column_index, column in enumerate(field):
+            stack_rows = [cell_index for cell_index, cell in enumerate(column) if cell[0] in " *" and cell != "   "]
+            self._column_heights.append(len(column) - stack_rows[0] if stack_rows else 0)
+            self._matched_cells.update((column_index, cell_index) for cell_index in stack_rows
+                                       if column[cell_index][0] == "*")
+
+    def _track(self, field: [[str]]) -> None:
+        """
+        Finds the faller again, measures the columns again and forgets the board hash and the dirty
+        cells if the given field is not the one this game state has been updating, since it may have been
+        changed in ways that were not recorded.
+        """
+        if field is not self.field:
+            self.faller = self._find_faller(field)
+            self._dirty_cells = None
+            self._index_field(field)
+            self._board_hash = None
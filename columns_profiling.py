@@ -0,0 +1,190 @@
+import functools
+import json
+import os
+import random
+import time
+
+import columns_mechanics
+
+
+RESERVOIR_SIZE = 1024
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class CallStats:
+    def __init__(self, name: str, reservoir_size: int = RESERVOIR_SIZE) -> None:
+        """
+        Initializes the timings of one instrumented method: how often it was called, the total and the
+        last time it took, and a reservoir of at most reservoir_size call times sampled evenly from all
+        calls, from which the percentiles are estimated.
+        """
+        self.name = name
+        self.reservoir_size = reservoir_size
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Forgets every call recorded so far.
+        """
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self._samples = []
+        self._rng = random.Random(self.name)
+
+    def record(self, duration: float) -> None:
+        """
+        Adds the time one call took, in seconds.
+        """
+        self.count += 1
+        self.total += duration
+        self.last = duration
+        if len(self._samples) < self.reservoir_size:
+            self._samples.append(duration)
+        else:
+            index = self._rng.randrange(self.count)
+            if index < self.reservoir_size:
+                self._samples[index] = duration
+
+    def percentile(self, fraction: float) -> float:
+        """
+        Returns the estimated call time below which the given fraction of the calls took, or 0 if the
+        method has not been called.
+        """
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        return samples[min(int(fraction * len(samples)), len(samples) - 1)]
+
+    def as_dict(self) -> dict:
+        """
+        Returns the timings as a dictionary that can be written out as JSON.
+        """
+        return {"count": self.count, "total": self.total, "mean": self.total / self.count if self.count else 0.0,
+                "last": self.last,
+                "percentiles": {str(fraction): self.percentile(fraction) for fraction in PERCENTILES}}
+
+    def __repr__(self) -> str:
+        return f"CallStats(name={self.name!r}, count={self.count}, total={self.total:.6f})"
+
+
+class Profiler:
+    def __init__(self) -> None:
+        """
+        Initializes a profiler with no instrumented methods. Methods are only timed between install and
+        uninstall; until then the classes are untouched, so a game without a profiler pays nothing.
+        """
+        self.stats = {}
+        self._installed = {}
+        self._depths = {}
+
+    def install(self, owner: type, names: [str] = None, prefix: str = None) -> None:
+        """
+        Replaces the named methods of the class with versions that time every call. The names default to
+        every public method defined on the class. The timings are kept under "<prefix>.<name>", where the
+        prefix defaults to the name of the class. A call made from inside another timed method of the same
+        class is not counted, so the time it takes is only recorded once, in the outer call. The methods
+        are replaced on the class itself, so every instance is timed until uninstall puts them back.
+        """
+        if names is None:
+            names = [name for name, value in vars(owner).items() if callable(value) and not name.startswith("_")]
+        if prefix is None:
+            prefix = owner.__name__
+        depth = self._depths.setdefault(owner, [0])
+
+        for name in names:
+            if (owner, name) in self._installed:
+                continue
+            original = vars(owner)[name]
+            label = f"{prefix}.{name}"
+            stats = self.stats.setdefault(label, CallStats(label))
+            self._installed[(owner, name)] = original
+            setattr(owner, name, self._timed(original, stats, depth))
+
+    def install_game_state(self) -> None:
+        """
+        Times every public GameState method.
+        """
+        self.install(columns_mechanics.GameState)
+
+    def uninstall(self) -> None:
+        """
+        Puts back every method that install replaced. The timings recorded so far are kept.
+        """
+        for (owner, name), original in self._installed.items():
+            setattr(owner, name, original)
+        self._installed = {}
+        self._depths = {}
+
+    def reset(self) -> None:
+        """
+        Forgets every timing recorded so far.
+        """
+        for stats in self.stats.values():
+            stats.reset()
+
+    def snapshot(self) -> dict:
+        """
+        Returns the timings of every instrumented method as a dictionary that can be written out as JSON.
+        """
+        return {label: stats.as_dict() for label, stats in sorted(self.stats.items())}
+
+    def to_json(self) -> str:
+        """
+        Returns the timings as a JSON document.
+        """
+        return json.dumps({"time": time.time(), "methods": self.snapshot()}, indent=2)
+
+    def to_prometheus(self) -> str:
+        """
+        Returns the timings in the Prometheus text exposition format: a call counter and a summary of the
+        call times, in seconds, for every instrumented method.
+        """
+        lines = ["# HELP columns_calls_total Number of calls of an instrumented method.",
+                 "# TYPE columns_calls_total counter"]
+        for label, stats in sorted(self.stats.items()):
+            lines.append(f'columns_calls_total{{method="{label}"}} {stats.count}')
+
+        lines += ["# HELP columns_call_seconds Time spent in an instrumented method.",
+                  "# TYPE columns_call_seconds summary"]
+        for label, stats in sorted(self.stats.items()):
+            for fraction in PERCENTILES:
+                lines.append(f'columns_call_seconds{{method="{label}",quantile="{fraction}"}} '
+                             f'{stats.percentile(fraction)!r}')
+            lines.append(f'columns_call_seconds_sum{{method="{label}"}} {stats.total!r}')
+            lines.append(f'columns_call_seconds_count{{method="{label}"}} {stats.count}')
+
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """
+        Writes the timings to a file, in the Prometheus text format if the path ends in .prom and as JSON
+        otherwise. The file is replaced in one step so that a reader never sees half of it.
+        """
+        text = self.to_prometheus() if path.endswith(".prom") else self.to_json()
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as profile_file:
+            profile_file.write(text)
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def _timed(function, stats: CallStats, depth: [int]):
+        """
+        Returns a version of the function that records how long every call takes, unless it is called
+        while another method sharing the depth counter is already running.
+        """
+        perf_counter = time.perf_counter
+
+        @functools.wraps(function)
+        def timed(*arguments, **keywords):
+            if depth[0]:
+                return function(*arguments, **keywords)
+            depth[0] += 1
+            start = perf_counter()
+            try:
+                return function(*arguments, **keywords)
+            finally:
+                stats.record(perf_counter() - start)
+                depth[0] -= 1
+
+        return timed
@@ -0,0 +1,233 @@
+import argparse
+import bisect
+import json
+import os
+import struct
+import sys
+
+
+MAGIC = b"CLRP"
+VERSION = 1
+HEADER = struct.Struct("<4sBHHq")
+
+TICK = 0
+LEFT = 1
+RIGHT = 2
+SPACE = 3
+EVENT_NAMES = ("TICK", "LEFT", "RIGHT", "SPACE")
+KEY_EVENTS = {"LEFT": LEFT, "RIGHT": RIGHT, "SPACE": SPACE}
+MAX_RUN = 64
+
+
+class ReplayWriter:
+    def __init__(self, file, rows: int, columns: int, seed: int, buffer_size: int = 1 << 16) -> None:
+        """
+        Initializes a writer that appends the events of one game to a binary log, given as a path or as
+        a binary file object. The log starts with a header holding the magic bytes, the format version,
+        the size of the field and the seed the fallers are generated from. Every event after that is
+        one byte: the event in the top two bits and how many times in a row it happened, minus one, in
+        the low six bits, so a run of up to 64 ticks or identical key presses takes a single byte.
+        The bytes are collected in a buffer and only written out once it holds buffer_size bytes.
+        """
+        if isinstance(file, (str, os.PathLike)):
+            file = open(file, "wb")
+            self._owns_file = True
+        else:
+            self._owns_file = False
+        self._file = file
+        self.buffer_size = buffer_size
+        self._buffer = bytearray(HEADER.pack(MAGIC, VERSION, rows, columns, seed))
+        self._event = None
+        self._run = 0
+
+    def tick(self) -> None:
+        """
+        Records a timer tick.
+        """
+        self._append(TICK)
+
+    def key(self, key: str) -> None:
+        """
+        Records a key press ("LEFT", "RIGHT" or "SPACE").
+        """
+        try:
+            self._append(KEY_EVENTS[key])
+        except KeyError:
+            raise ValueError(f"unknown key {key!r}") from None
+
+    def flush(self) -> None:
+        """
+        Writes out every event recorded so far.
+        """
+        self._end_run()
+        self._write_buffer()
+        self._file.flush()
+
+    def close(self) -> None:
+        """
+        Writes out every event recorded so far and closes the log if the writer opened it.
+        """
+        self.flush()
+        if self._owns_file:
+            self._file.close()
+
+    def _append(self, event: int) -> None:
+        """
+        Adds the event to the current run, or ends the run and starts a new one.
+        """
+        if event == self._event and self._run < MAX_RUN:
+            self._run += 1
+            return
+
+        self._end_run()
+        self._event = event
+        self._run = 1
+
+    def _end_run(self) -> None:
+        """
+        Adds the byte of the current run to the buffer and writes the buffer out if it is full.
+        """
+        if self._event is None:
+            return
+
+        self._buffer.append(self._event << 6 | self._run - 1)
+        self._event = None
+        self._run = 0
+        if len(self._buffer) >= self.buffer_size:
+            self._write_buffer()
+
+    def _write_buffer(self) -> None:
+        """
+        Appends the buffered bytes to the log.
+        """
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer = bytearray()
+
+    def __enter__(self) -> "ReplayWriter":
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.close()
+
+
+class Replay:
+    def __init__(self, rows: int, columns: int, seed: int, events: bytearray) -> None:
+        """
+        Initializes a decoded log: the size of the field, the seed and one byte per event
+        (TICK, LEFT, RIGHT or SPACE), with the runs expanded.
+        """
+        self.rows = rows
+        self.columns = columns
+        self.seed = seed
+        self.events = events
+
+    @property
+    def ticks(self) -> int:
+        """
+        Returns the number of ticks in the log.
+        """
+        return self.events.count(TICK)
+
+    def __repr__(self) -> str:
+        return f"Replay(rows={self.rows}, columns={self.columns}, seed={self.seed}, events={len(self.events)})"
+
+
+def decode_replay(data: bytes) -> Replay:
+    """
+    Decodes the bytes of a log written by ReplayWriter.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("the replay log is too short to hold a header")
+    magic, version, rows, columns, seed = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("the file is not a replay log")
+    if version != VERSION:
+        raise ValueError(f"unsupported replay log version {version}")
+
+    runs = [bytes((byte >> 6,)) * ((byte & 0x3F) + 1) for byte in data[HEADER.size:]]
+    return Replay(rows, columns, seed, bytearray(b"".join(runs)))
+
+
+def read_replay(path: str) -> Replay:
+    """
+    Reads and decodes a log written by ReplayWriter.
+    """
+    with open(path, "rb") as replay_file:
+        return decode_replay(replay_file.read())
+
+
+class Replayer:
+    def __init__(self, replay: Replay, snapshot_interval: int = 1000) -> None:
+        """
+        Initializes a replayer that plays a log again on a HeadlessGame, with no rendering or timers.
+        Every snapshot_interval ticks a snapshot of the game is kept, so seeking back to an earlier tick
+        only replays the events since the closest snapshot before it.
+        """
+        self.replay = replay
+        self.snapshot_interval = snapshot_interval
+        game = self._new_game()
+        game.spawn()
+        self._snapshot_ticks = [0]
+        self._snapshots = [(0, game.snapshot())]
+
+    def seek(self, tick: int) -> "columns_headless.HeadlessGame":
+        """
+        Returns the game as it was right after the given tick, before any of the keys pressed after it.
+        If the log or the game ends earlier, the game is returned as it was at the end.
+        """
+        position, snapshot = self._snapshots[bisect.bisect_right(self._snapshot_ticks, tick) - 1]
+        game = self._new_game()
+        game.restore(snapshot)
+        events = self.replay.events
+        while game.ticks < tick and position < len(events) and game.end_reason is None:
+            event = events[position]
+            position += 1
+            if event != TICK:
+                game.press(EVENT_NAMES[event])
+                continue
+
+            game.tick()
+            if game.end_reason is None and game.ready_for_faller():
+                game.spawn()
+            if game.ticks % self.snapshot_interval == 0 and game.ticks > self._snapshot_ticks[-1]:
+                self._snapshot_ticks.append(game.ticks)
+                self._snapshots.append((position, game.snapshot()))
+
+        return game
+
+    def _new_game(self) -> "columns_headless.HeadlessGame":
+        """
+        Returns a new game of the log's size with fallers generated from the log's seed. The headless
+        runner is only imported here, so that Game can record logs without loading it.
+        """
+        import columns_headless
+
+        return columns_headless.HeadlessGame(self.replay.rows, self.replay.columns, self.replay.seed)
+
+    def run(self) -> "columns_headless.GameResult":
+        """
+        Replays the whole log and returns the result of the game.
+        """
+        return self.seek(self.replay.ticks).result()
+
+
+def main(argv: [str] = None) -> None:
+    """
+    Replays a log and writes the result of the game, or the field at the given tick, as JSON.
+    """
+    parser = argparse.ArgumentParser(description="Replay a Columns replay log without a window.")
+    parser.add_argument("log")
+    parser.add_argument("--tick", type=int, help="print the field right after this tick")
+    arguments = parser.parse_args(argv)
+
+    replayer = Replayer(read_replay(arguments.log))
+    if arguments.tick is None:
+        sys.stdout.write(json.dumps(replayer.run().as_dict()) + "\n")
+    else:
+        game = replayer.seek(arguments.tick)
+        sys.stdout.write(json.dumps({"tick": game.ticks, "field": game.field}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
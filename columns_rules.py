@@ -0,0 +1,32 @@
+import random
+
+
+FALLER_JEWELS = ["S", "T", "V", "W", "X", "Y", "Z"]
+
+
+def next_faller(rng: random.Random, columns: int) -> (int, [str]):
+    """
+    Generates the next faller from a random number generator and returns the column it is dropped into,
+    counting from 1, and its three jewels. Game, HeadlessGame and columns_batch all generate fallers this way.
+    """
+    column = rng.randint(1, columns)
+    return column, [rng.choice(FALLER_JEWELS) for number in range(3)]
+
+
+def run_tick(game_state: "columns_mechanics.GameState", field: [[str]], rows: int) -> ([[str]], int):
+    """
+    Runs the steps of one timer tick: the faller falls, matches are marked, the jewels that were already
+    matched are cleared and matches are marked again, and the game state checks if the game has ended.
+    Returns the updated field and the number of jewels that were cleared.
+    """
+    asterisks_present = game_state.checking_for_asterisks(field)
+    field = game_state.fall(field)
+    field = game_state.matching(field)
+    cleared_jewels = 0
+    if asterisks_present:
+        cleared_jewels = sum(cell[0] == "*" for column in field for cell in column)
+        field = game_state.clear(field)
+        field = game_state.matching(field)
+
+    game_state.check_end_game(field, rows)
+    return field, cleared_jewels
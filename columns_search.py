@@ -0,0 +1,261 @@
+import math
+import multiprocessing
+
+import columns_grid
+import columns_mechanics
+
+
+CLEAR_WEIGHT = 10.0
+
+
+class Placement:
+    def __init__(self, column: int, rotation: int, jewels: (str, ...), grid: columns_grid.Grid, cleared: int,
+                 cascades: int, game_over: bool, keys: [str]) -> None:
+        """
+        Initializes one final resting place of a faller: the column it lands in, how many times it was
+        rotated, its jewels from top to bottom after the rotations, the stable grid left once every
+        cascade has been resolved, how many jewels were cleared in how many cascades, whether the game
+        is over afterwards, and the keys that move the faller there from where it is now.
+        """
+        self.column = column
+        self.rotation = rotation
+        self.jewels = jewels
+        self.grid = grid
+        self.cleared = cleared
+        self.cascades = cascades
+        self.game_over = game_over
+        self.keys = keys
+
+    def __repr__(self) -> str:
+        return (f"Placement(column={self.column}, rotation={self.rotation}, jewels={self.jewels}, "
+                f"cleared={self.cleared}, game_over={self.game_over})")
+
+
+class SearchResult:
+    def __init__(self, placement: Placement, value: float, nodes: int) -> None:
+        """
+        Initializes the outcome of a search: the best placement for the current faller (None if every
+        placement ends the game), the value the search gave it and how many placements were examined.
+        """
+        self.placement = placement
+        self.value = value
+        self.nodes = nodes
+
+    def __repr__(self) -> str:
+        return f"SearchResult(placement={self.placement}, value={self.value}, nodes={self.nodes})"
+
+
+def settled_grid(game_state: columns_mechanics.GameState, field: [[str]]) -> columns_grid.Grid:
+    """
+    Returns a compact grid of the field without the game state's faller. The field has to be the one
+    the game state has been updating.
+    """
+    grid = columns_grid.Grid.from_field(field)
+    faller = game_state.faller
+    if faller is not None:
+        for row in range(faller.top, faller.bottom + 1):
+            grid.set(faller.column, row, columns_grid.EMPTY)
+    return grid
+
+
+def entry_bottom(heights: [int], height: int, column: int, size: int = 3) -> int:
+    """
+    Returns the row of the bottom jewel of a faller right after it has been dropped into the column,
+    the same way GameState.drop places it.
+    """
+    first_row = 0 if height - heights[column] <= 3 else 1
+    return first_row + size - 1
+
+
+def reachable_columns(heights: [int], height: int, column: int, bottom: int) -> [int]:
+    """
+    Returns every column a faller whose bottom jewel is on the given row can be moved to, from left
+    to right. A faller can only move sideways while the cell beside its bottom jewel is empty, and
+    moving right away is never worse than moving after it has fallen further.
+    """
+    left = column
+    while left > 0 and bottom < height - heights[left - 1]:
+        left -= 1
+    right = column
+    while right < len(heights) - 1 and bottom < height - heights[right + 1]:
+        right += 1
+    return list(range(left, right + 1))
+
+
+def _forms_match(grid: columns_grid.Grid, column: int, rows: range) -> bool:
+    """
+    Returns True if one of the given cells of the column is part of a run of three or more frozen
+    jewels of the same color.
+    """
+    cells = grid.cells
+    height = grid.height
+    for row in rows:
+        color = cells[column * height + row]
+        for column_step, row_step in ((1, 0), (0, 1), (1, 1), (1, -1)):
+            length = 1
+            for direction in (1, -1):
+                next_column = column + column_step * direction
+                next_row = row + row_step * direction
+                while 0 <= next_column < grid.columns and 0 <= next_row < height \
+                        and cells[next_column * height + next_row] == color:
+                    length += 1
+                    next_column += column_step * direction
+                    next_row += row_step * direction
+            if length >= 3:
+                return True
+
+    return False
+
+
+def generate_placements(grid: columns_grid.Grid, column: int, jewels: [str], bottom: int = None,
+                        heights: [int] = None) -> [Placement]:
+    """
+    Returns every placement a faller with the given jewels (top to bottom) in the given column can
+    reach, one for every reachable column and every distinct rotation. The grid must not hold the
+    faller itself. The bottom is the row of the faller's bottom jewel and defaults to the row it enters
+    at. Each placement stacks the jewels on the column and resolves the cascades on a copy of the grid;
+    the cascades are only resolved if one of the new jewels completes a run.
+    """
+    if heights is None:
+        heights = grid.column_heights()
+    if bottom is None:
+        bottom = entry_bottom(heights, grid.height, column, len(jewels))
+
+    rotations = []
+    for rotation in range(len(jewels)):
+        rotated = tuple(jewels[len(jewels) - rotation:] + jewels[:len(jewels) - rotation])
+        if rotated not in (rotated_jewels for rotation_count, rotated_jewels in rotations):
+            rotations.append((rotation, rotated))
+
+    placements = []
+    for target in reachable_columns(heights, grid.height, column, bottom):
+        top = grid.height - heights[target] - len(jewels)
+        if top < 0:
+            continue
+        moves = ["LEFT"] * (column - target) + ["RIGHT"] * (target - column)
+        for rotation, rotated in rotations:
+            placed = grid.copy()
+            for row, jewel in enumerate(rotated, top):
+                placed.set(target, row, columns_grid.encode_cell(f" {jewel} "))
+
+            cleared_masks = []
+            if _forms_match(placed, target, range(top, top + len(rotated))):
+                cleared_masks = placed.resolve_cascades()
+            cleared = sum(cleared_mask.count(1) for cleared_mask in cleared_masks)
+            game_over = max(placed.column_heights()) > grid.rows
+            placements.append(Placement(target, rotation, rotated, placed, cleared, len(cleared_masks), game_over,
+                                        ["SPACE"] * rotation + moves))
+
+    return placements
+
+
+def faller_placements(game_state: columns_mechanics.GameState, field: [[str]]) -> [Placement]:
+    """
+    Returns every placement the game state's current faller can reach from where it is now, or an
+    empty list if there is no faller. The field has to be the one the game state has been updating.
+    """
+    faller = game_state.faller
+    if faller is None:
+        return []
+    return generate_placements(settled_grid(game_state, field), faller.column, faller.jewels, faller.bottom)
+
+
+def evaluate_grid(grid: columns_grid.Grid) -> float:
+    """
+    Returns how good a stable grid is for the player: the lower and flatter the columns, the better.
+    """
+    heights = grid.column_heights()
+    return -sum(height * height for height in heights) / len(heights)
+
+
+def _placement_value(placement: Placement, fallers: [(int, [str])], depth: int, beam_width: int, evaluate,
+                     transpositions: dict, counter: [int]) -> float:
+    """
+    Returns the value of a placement: the jewels it clears, weighted by CLEAR_WEIGHT, plus the best
+    value that the following fallers can reach from its grid, looking depth fallers further ahead.
+    """
+    if placement.game_over:
+        return -math.inf
+    return placement.cleared * CLEAR_WEIGHT + _grid_value(placement.grid, fallers, depth, beam_width, evaluate,
+                                                          transpositions, counter)
+
+
+def _grid_value(grid: columns_grid.Grid, fallers: [(int, [str])], depth: int, beam_width: int, evaluate,
+                transpositions: dict, counter: [int]) -> float:
+    """
+    Returns the best value reachable from a stable grid with the next fallers. Only the beam_width
+    placements that look best on their own are searched any deeper, and a grid that has already been
+    valued at the same depth is not searched again.
+    """
+    if depth == 0 or not fallers:
+        return evaluate(grid)
+
+    key = (bytes(grid.cells), depth)
+    if key in transpositions:
+        return transpositions[key]
+
+    column, jewels = fallers[0]
+    placements = [placement for placement in generate_placements(grid, column, jewels) if not placement.game_over]
+    counter[0] += len(placements)
+    if not placements:
+        transpositions[key] = -math.inf
+        return -math.inf
+
+    placements.sort(key=lambda placement: placement.cleared * CLEAR_WEIGHT + evaluate(placement.grid), reverse=True)
+    value = max(_placement_value(placement, fallers[1:], depth - 1, beam_width, evaluate, transpositions, counter)
+                for placement in placements[:beam_width])
+    transpositions[key] = value
+    return value
+
+
+def _root_value(arguments: tuple) -> (float, int):
+    """
+    Values one root placement in a worker process and returns the value and the number of examined placements.
+    """
+    placement, fallers, depth, beam_width, evaluate = arguments
+    counter = [0]
+    return _placement_value(placement, fallers, depth, beam_width, evaluate, {}, counter), counter[0]
+
+
+def search(grid: columns_grid.Grid, column: int, jewels: [str], upcoming: [(int, [str])] = (), depth: int = 1,
+           bottom: int = None, beam_width: int = 6, evaluate=evaluate_grid, processes: int = 1) -> SearchResult:
+    """
+    Searches for the best placement of a faller on a stable grid. The upcoming fallers are the
+    (column, jewels) pairs that will be dropped next; the search looks at most depth - 1 of them
+    ahead. Placements that end the game are pruned, and below the root only the beam_width most
+    promising placements of each faller are followed. The root placements are valued across a pool
+    of worker processes if processes is not 1; the evaluation function then has to be a module level
+    function so it can be sent to the workers.
+    """
+    placements = generate_placements(grid, column, jewels, bottom)
+    upcoming = list(upcoming)[:max(depth - 1, 0)]
+    arguments = [(placement, upcoming, depth - 1, beam_width, evaluate) for placement in placements]
+    if processes == 1:
+        results = list(map(_root_value, arguments))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(_root_value, arguments)
+
+    best_placement = None
+    best_value = -math.inf
+    nodes = len(placements)
+    for placement, (value, examined) in zip(placements, results):
+        nodes += examined
+        if value > best_value:
+            best_placement = placement
+            best_value = value
+
+    return SearchResult(best_placement, best_value, nodes)
+
+
+def search_faller(game_state: columns_mechanics.GameState, field: [[str]], upcoming: [(int, [str])] = (),
+                  depth: int = 1, beam_width: int = 6, evaluate=evaluate_grid, processes: int = 1) -> SearchResult:
+    """
+    Searches for the best placement of the game state's current faller from where it is now.
+    The field has to be the one the game state has been updating.
+    """
+    faller = game_state.faller
+    if faller is None:
+        return SearchResult(None, -math.inf, 0)
+    return search(settled_grid(game_state, field), faller.column, faller.jewels, upcoming, depth, faller.bottom,
+                  beam_width, evaluate, processes)
@@ -0,0 +1,561 @@
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import random
+import sys
+import time
+
+import columns_grid
+import columns_headless
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_INTERVAL = 0.5
+KEYS_PER_TICK = 4
+MAX_PENDING_KEYS = 64
+HIGH_WATER = 1 << 16
+BATCH_SIZE = 256
+
+
+class Session:
+    def __init__(self, session_id: int, connection: "Connection", game: columns_headless.HeadlessGame) -> None:
+        """
+        Initializes one game hosted by the server: its id, the connection that plays it, the headless
+        game and the keys that have been received but not applied yet. The packed cells of the field
+        as the client last saw it are kept so that only the cells that changed since then are sent.
+        """
+        self.id = session_id
+        self.connection = connection
+        self.game = game
+        self.pending_keys = collections.deque()
+        self.needs_sync = True
+        self._sent_cells = b""
+
+    def advance(self, keys_per_tick: int) -> int:
+        """
+        Runs one tick of the game: drops a new faller if the board has settled, applies at most
+        keys_per_tick of the pending keys and lets the timer fire once. Returns the number of keys applied.
+        """
+        game = self.game
+        if game.end_reason is None and game.ready_for_faller():
+            game.spawn()
+
+        applied = 0
+        while self.pending_keys and applied < keys_per_tick and game.end_reason is None:
+            game.press(self.pending_keys.popleft())
+            applied += 1
+
+        if game.end_reason is None:
+            game.tick()
+            if game.end_reason is None and game.ticks >= game.max_ticks:
+                game.end_reason = "tick_limit"
+
+        return applied
+
+    def changes(self) -> [[int, int, str]]:
+        """
+        Returns the [column, row, cell] of every cell that changed since the field was last sent, and
+        remembers the field as sent.
+        """
+        cells = columns_grid.Grid.from_field(self.game.field).cells
+        previous_cells = self._sent_cells
+        self._sent_cells = cells
+        if cells == previous_cells:
+            return []
+
+        height = self.game.rows + 3
+        return [[index // height, index % height, columns_grid.decode_cell(cells[index])]
+                for index in range(len(cells)) if cells[index] != previous_cells[index]]
+
+    def sync(self) -> [[str]]:
+        """
+        Returns the whole field and remembers it as sent.
+        """
+        self._sent_cells = columns_grid.Grid.from_field(self.game.field).cells
+        self.needs_sync = False
+        return self.game.field
+
+
+class Connection:
+    def __init__(self, server: "GameServer", reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Initializes one client connection: the sessions it plays, the number of keys it has sent that
+        have not been applied yet, an event that is set while it may send more keys and the task that
+        reads its requests.
+        """
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.sessions = {}
+        self.pending_keys = 0
+        self.room = asyncio.Event()
+        self.room.set()
+        self.task = asyncio.current_task()
+
+    @property
+    def congested(self) -> bool:
+        """
+        Returns True if the client is not reading fast enough, so the data waiting to be sent to it
+        has grown past the server's high water mark, or if the connection is closing.
+        """
+        transport = self.writer.transport
+        return transport.is_closing() or transport.get_write_buffer_size() > self.server.high_water
+
+    def send(self, message: dict) -> None:
+        """
+        Queues one message to the client as a line of JSON. Writing never waits, so a slow client cannot
+        hold up the tick of every other session.
+        """
+        if not self.writer.transport.is_closing():
+            self.writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+
+    def keys_applied(self, count: int) -> None:
+        """
+        Counts keys of this connection that a tick has applied, and lets the connection send keys again
+        once it is back under the limit of pending keys.
+        """
+        self.pending_keys -= count
+        if self.pending_keys < self.server.max_pending_keys:
+            self.room.set()
+
+
+class TickScheduler:
+    def __init__(self, interval: float = DEFAULT_INTERVAL, keys_per_tick: int = KEYS_PER_TICK,
+                 batch_size: int = BATCH_SIZE) -> None:
+        """
+        Initializes the one timer that ticks every session, every interval seconds. Sessions are ticked
+        batch_size at a time with a pause for the event loop in between, so connections are served while
+        a round of ticks runs. A round that takes longer than the interval is counted as an overrun, and
+        the rounds it missed are skipped instead of being run back to back.
+        """
+        self.interval = interval
+        self.keys_per_tick = keys_per_tick
+        self.batch_size = batch_size
+        self.sessions = {}
+        self.rounds = 0
+        self.ticks = 0
+        self.overruns = 0
+        self.last_round = 0.0
+        self.total_round_time = 0.0
+        self._task = None
+
+    def add(self, session: Session) -> None:
+        """
+        Starts ticking a session on the next round.
+        """
+        self.sessions[session.id] = session
+
+    def remove(self, session: Session) -> None:
+        """
+        Stops ticking a session.
+        """
+        self.sessions.pop(session.id, None)
+
+    def start(self) -> None:
+        """
+        Starts the timer on the running event loop.
+        """
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stops the timer and waits for it to finish.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_round(self) -> None:
+        """
+        Ticks every session once and sends each client what changed on its boards.
+        """
+        start = time.perf_counter()
+        sessions = list(self.sessions.values())
+        for batch_start in range(0, len(sessions), self.batch_size):
+            if batch_start:
+                await asyncio.sleep(0)
+            for session in sessions[batch_start:batch_start + self.batch_size]:
+                if self.sessions.get(session.id) is session:
+                    self._tick_session(session)
+
+        self.rounds += 1
+        self.last_round = time.perf_counter() - start
+        self.total_round_time += self.last_round
+
+    def stats(self) -> dict:
+        """
+        Returns the number of sessions, rounds, session ticks and overruns and how long the rounds took.
+        """
+        return {"sessions": len(self.sessions), "rounds": self.rounds, "ticks": self.ticks,
+                "overruns": self.overruns, "last_round": self.last_round,
+                "mean_round": self.total_round_time / self.rounds if self.rounds else 0.0}
+
+    def _tick_session(self, session: Session) -> None:
+        """
+        Ticks one session and sends its client the changed cells, the whole field if the client has to
+        catch up, or the result once the game is over. Nothing but the result is sent to a congested
+        client; its session is synced again once the client has caught up.
+        """
+        connection = session.connection
+        game = session.game
+        connection.keys_applied(session.advance(self.keys_per_tick))
+        self.ticks += 1
+
+        if game.end_reason is not None:
+            connection.server.end_session(session)
+        elif connection.congested:
+            session.needs_sync = True
+        elif session.needs_sync:
+            connection.send({"event": "sync", "session": session.id, "tick": game.ticks, "field": session.sync()})
+        else:
+            changes = session.changes()
+            if changes:
+                connection.send({"event": "diff", "session": session.id, "tick": game.ticks, "changes": changes})
+
+    async def _run(self) -> None:
+        """
+        Runs a round of ticks every interval seconds until the timer is stopped.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.interval
+        while True:
+            await asyncio.sleep(max(deadline - loop.time(), 0))
+            await self.run_round()
+            deadline += self.interval
+            now = loop.time()
+            if now > deadline:
+                missed = int((now - deadline) // self.interval) + 1
+                self.overruns += 1
+                deadline += missed * self.interval
+
+
+class GameServer:
+    def __init__(self, host: str = DEFAULT_HOST, port: int = 0, interval: float = DEFAULT_INTERVAL,
+                 rows: int = 13, columns: int = 6, max_ticks: int = 100000, keys_per_tick: int = KEYS_PER_TICK,
+                 max_pending_keys: int = MAX_PENDING_KEYS, high_water: int = HIGH_WATER,
+                 batch_size: int = BATCH_SIZE) -> None:
+        """
+        Initializes a server that hosts headless games for clients on a local socket, all of them ticked by
+        one TickScheduler. Clients send and receive one JSON object per line:
+
+            {"op": "new", "seed": 1}                      -> {"event": "created", "session": 1, "field": [...]}
+            {"op": "key", "session": 1, "key": "LEFT"}    (LEFT, RIGHT or SPACE, applied on the next tick)
+            {"op": "close", "session": 1}                 -> {"event": "over", "session": 1, "result": {...}}
+
+        On every tick a client gets a "diff" with the [column, row, cell] of each changed cell of its
+        sessions, or a "sync" with the whole field after it has fallen behind, and an "over" with the
+        result when a game ends. A session runs for at most max_ticks ticks and applies at most
+        keys_per_tick keys per tick. A connection that has max_pending_keys keys waiting is not read from
+        until its keys have been applied, and one that has more than high_water bytes waiting to be sent
+        gets no updates until it has read them.
+        """
+        self.host = host
+        self.port = port
+        self.rows = rows
+        self.columns = columns
+        self.max_ticks = max_ticks
+        self.max_pending_keys = max_pending_keys
+        self.high_water = high_water
+        self.scheduler = TickScheduler(interval, keys_per_tick, batch_size)
+        self.connections = set()
+        self._session_ids = itertools.count(1)
+        self._server = None
+
+    async def start(self) -> int:
+        """
+        Starts listening and ticking and returns the port the server listens on.
+        """
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.scheduler.start()
+        return self.port
+
+    async def serve_forever(self) -> None:
+        """
+        Starts the server if it has not been started and serves clients until it is cancelled.
+        """
+        if self._server is None:
+            await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    async def close(self) -> None:
+        """
+        Stops ticking, ends every session and closes every connection.
+        """
+        await self.scheduler.stop()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        connections = list(self.connections)
+        for connection in connections:
+            connection.room.set()
+            connection.writer.close()
+        await asyncio.gather(*(connection.task for connection in connections), return_exceptions=True)
+
+    def new_session(self, connection: Connection, seed: int = None) -> Session:
+        """
+        Creates a session for the connection with fallers generated from the seed and starts ticking it.
+        """
+        game = columns_headless.HeadlessGame(self.rows, self.columns, seed, max_ticks=self.max_ticks)
+        session = Session(next(self._session_ids), connection, game)
+        connection.sessions[session.id] = session
+        self.scheduler.add(session)
+        connection.send({"event": "created", "session": session.id, "seed": game.seed, "field": session.sync()})
+        return session
+
+    def end_session(self, session: Session, reason: str = None) -> None:
+        """
+        Stops ticking a session and sends its result to the client.
+        """
+        connection = session.connection
+        if reason is not None and session.game.end_reason is None:
+            session.game.end_reason = reason
+        self.scheduler.remove(session)
+        connection.sessions.pop(session.id, None)
+        connection.keys_applied(len(session.pending_keys))
+        session.pending_keys.clear()
+        connection.send({"event": "over", "session": session.id, "result": session.game.result().as_dict()})
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Reads the requests of one client until it disconnects, then drops its sessions.
+        """
+        connection = Connection(self, reader, writer)
+        self.connections.add(connection)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    break
+                if not line:
+                    break
+                await self._handle_request(connection, line)
+        finally:
+            for session in list(connection.sessions.values()):
+                self.scheduler.remove(session)
+            connection.sessions.clear()
+            self.connections.discard(connection)
+            writer.close()
+
+    async def _handle_request(self, connection: Connection, line: bytes) -> None:
+        """
+        Carries out one request of a client, or sends it an error if the request is not valid.
+        """
+        try:
+            request = json.loads(line)
+            operation = request["op"]
+        except (ValueError, TypeError, KeyError):
+            connection.send({"event": "error", "error": "a request must be a JSON object with an op"})
+            return
+
+        if operation == "new":
+            seed = request.get("seed")
+            if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool)):
+                connection.send({"event": "error", "error": "the seed must be an integer"})
+                return
+            self.new_session(connection, seed)
+            return
+
+        session_id = request.get("session")
+        session = None
+        if isinstance(session_id, int) and not isinstance(session_id, bool):
+            session = connection.sessions.get(session_id)
+        if operation not in ("key", "close"):
+            connection.send({"event": "error", "error": f"unknown op {operation!r}"})
+        elif session is None:
+            connection.send({"event": "error", "error": f"unknown session {request.get('session')!r}"})
+        elif operation == "close":
+            self.end_session(session, "closed")
+        elif request.get("key") not in columns_headless.KEYS:
+            connection.send({"event": "error", "error": f"unknown key {request.get('key')!r}"})
+        else:
+            session.pending_keys.append(request["key"])
+            connection.pending_keys += 1
+            if connection.pending_keys >= self.max_pending_keys:
+                connection.room.clear()
+                await connection.room.wait()
+
+
+def apply_event(field: [[str]], event: dict) -> [[str]]:
+    """
+    Returns the field of a session as the client sees it after a message from the server: the whole
+    field of a "created" or "sync", or the given field with the cells of a "diff" changed.
+    """
+    if event["event"] in ("created", "sync"):
+        return [list(column) for column in event["field"]]
+    if event["event"] == "diff":
+        for column, row, cell in event["changes"]:
+            field[column][row] = cell
+    return field
+
+
+class GameClient:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Initializes a client of a GameServer on an open connection. Messages that arrive while the client
+        waits for a particular one are kept for next_event.
+        """
+        self.reader = reader
+        self.writer = writer
+        self._events = collections.deque()
+
+    @classmethod
+    async def connect(cls, host: str = DEFAULT_HOST, port: int = 0) -> "GameClient":
+        """
+        Connects to a server and returns the client.
+        """
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def new_game(self, seed: int = None) -> dict:
+        """
+        Starts a session and returns the "created" message holding its id and field.
+        """
+        self._send({"op": "new"} if seed is None else {"op": "new", "seed": seed})
+        await self.writer.drain()
+        while True:
+            event = await self._read()
+            if event["event"] in ("created", "error"):
+                return event
+            self._events.append(event)
+
+    async def press(self, session: int, key: str) -> None:
+        """
+        Sends a key press for a session, waiting while the connection cannot take more data.
+        """
+        self._send({"op": "key", "session": session, "key": key})
+        await self.writer.drain()
+
+    async def end_game(self, session: int) -> None:
+        """
+        Asks the server to end a session; its result arrives as an "over" message.
+        """
+        self._send({"op": "close", "session": session})
+        await self.writer.drain()
+
+    async def next_event(self) -> dict:
+        """
+        Returns the next message from the server, or None once the server has closed the connection.
+        """
+        if self._events:
+            return self._events.popleft()
+        return await self._read()
+
+    async def close(self) -> None:
+        """
+        Closes the connection.
+        """
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    def _send(self, request: dict) -> None:
+        self.writer.write(json.dumps(request, separators=(",", ":")).encode() + b"\n")
+
+    async def _read(self) -> dict:
+        line = await self.reader.readline()
+        return json.loads(line) if line else None
+
+
+async def load_test(sessions: int = 1000, ticks: int = 20, connections: int = 4, interval: float = 0.05,
+                    key_rate: float = 0.2, seed: int = 0) -> dict:
+    """
+    Runs a server and clients on localhost in this process: the clients start the given number of
+    sessions over the given number of connections, press a random key on about key_rate of the sessions
+    after every tick, and keep a copy of every field from the messages they get. After the given number
+    of rounds the copies are compared with the fields on the server. Returns the scheduler's statistics,
+    the number of messages the clients got and the number of fields that did not match.
+    """
+    server = GameServer(interval=interval)
+    port = await server.start()
+    clients = [await GameClient.connect(DEFAULT_HOST, port) for number in range(connections)]
+    rng = random.Random(seed)
+    fields = {}
+    owners = {}
+    for number in range(sessions):
+        client = clients[number % connections]
+        created = await client.new_game(seed + number)
+        fields[created["session"]] = apply_event(None, created)
+        owners[created["session"]] = client
+
+    messages = 0
+    finished = asyncio.Event()
+
+    async def follow(client: GameClient) -> None:
+        nonlocal messages
+        while True:
+            event = await client.next_event()
+            if event is None:
+                return
+            messages += 1
+            if event["event"] == "over":
+                owners.pop(event["session"], None)
+            elif event["event"] in ("sync", "diff"):
+                fields[event["session"]] = apply_event(fields[event["session"]], event)
+                if rng.random() < key_rate and event["session"] in owners:
+                    await client.press(event["session"], rng.choice(columns_headless.KEYS))
+            if server.scheduler.rounds >= ticks:
+                finished.set()
+
+    followers = [asyncio.get_running_loop().create_task(follow(client)) for client in clients]
+    await finished.wait()
+    await server.scheduler.stop()
+    await asyncio.sleep(interval)
+
+    live_sessions = server.scheduler.sessions
+    mismatches = sum(1 for session_id, session in live_sessions.items()
+                     if not session.needs_sync and fields.get(session_id) != session.game.field)
+    result = dict(server.scheduler.stats(), messages=messages, mismatches=mismatches)
+    for follower in followers:
+        follower.cancel()
+    for client in clients:
+        await client.close()
+    await server.close()
+    return result
+
+
+def main(argv: [str] = None) -> None:
+    """
+    Serves Columns games on a local socket, or runs a load test on localhost and writes its statistics as JSON.
+    """
+    parser = argparse.ArgumentParser(description="Host Columns games for clients on a local socket.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=7230)
+    parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL, help="seconds between ticks")
+    parser.add_argument("--rows", type=int, default=13)
+    parser.add_argument("--columns", type=int, default=6)
+    parser.add_argument("--max-ticks", type=int, default=100000)
+    parser.add_argument("--load-test", type=int, metavar="SESSIONS",
+                        help="run this many sessions against a server on localhost and print the statistics")
+    parser.add_argument("--ticks", type=int, default=20, help="rounds of ticks to run in the load test")
+    arguments = parser.parse_args(argv)
+
+    if arguments.load_test is not None:
+        result = asyncio.run(load_test(arguments.load_test, arguments.ticks, interval=arguments.interval))
+        sys.stdout.write(json.dumps(result) + "\n")
+        return
+
+    server = GameServer(arguments.host, arguments.port, arguments.interval, arguments.rows, arguments.columns,
+                        arguments.max_ticks)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
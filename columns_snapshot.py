@@ -0,0 +1,87 @@
+import mmap
+import struct
+
+
+BATCH_MAGIC = b"CLSB"
+BATCH_HEADER = struct.Struct("<4sII")
+
+
+def write_snapshots(path: str, snapshots: [bytes]) -> int:
+    """
+    Writes a batch of game state snapshots of the same size to a file through a memory map and
+    returns the number of snapshots written. The file starts with a header holding the magic bytes,
+    the size of one snapshot and the number of snapshots, followed by the snapshots back to back.
+    """
+    if not snapshots:
+        raise ValueError("there are no snapshots to write")
+    record_size = len(snapshots[0])
+    if any(len(snapshot) != record_size for snapshot in snapshots):
+        raise ValueError("every snapshot in a batch must have the same size")
+
+    file_size = BATCH_HEADER.size + record_size * len(snapshots)
+    with open(path, "w+b") as batch_file:
+        batch_file.truncate(file_size)
+        with mmap.mmap(batch_file.fileno(), file_size) as mapped:
+            BATCH_HEADER.pack_into(mapped, 0, BATCH_MAGIC, record_size, len(snapshots))
+            offset = BATCH_HEADER.size
+            for snapshot in snapshots:
+                mapped[offset:offset + record_size] = snapshot
+                offset += record_size
+            mapped.flush()
+
+    return len(snapshots)
+
+
+class SnapshotBatch:
+    def __init__(self, path: str) -> None:
+        """
+        Opens a batch written by write_snapshots as a read-only memory map. Every snapshot is handed
+        out as a memoryview into the map, so nothing is read or copied until a snapshot is restored.
+        The views have to be released before the batch is closed.
+        """
+        self._file = open(path, "rb")
+        try:
+            self._mapped = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("the snapshot batch is empty") from None
+
+        if len(self._mapped) < BATCH_HEADER.size:
+            self.close()
+            raise ValueError("the file is not a snapshot batch")
+        magic, self.record_size, self._count = BATCH_HEADER.unpack_from(self._mapped)
+        if magic != BATCH_MAGIC or len(self._mapped) != BATCH_HEADER.size + self.record_size * self._count:
+            self.close()
+            raise ValueError("the file is not a snapshot batch")
+        self._view = memoryview(self._mapped)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index: int) -> memoryview:
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("snapshot index out of range")
+        offset = BATCH_HEADER.size + index * self.record_size
+        return self._view[offset:offset + self.record_size]
+
+    def __iter__(self):
+        for index in range(self._count):
+            yield self[index]
+
+    def close(self) -> None:
+        """
+        Closes the memory map and the file.
+        """
+        if getattr(self, "_view", None) is not None:
+            self._view.release()
+            self._view = None
+        self._mapped.close()
+        self._file.close()
+
+    def __enter__(self) -> "SnapshotBatch":
+        return self
+
+    def __exit__(self, *exception) -> None:
+        self.close()
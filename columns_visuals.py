@@ -1,72 +1,136 @@
-import pygame
+import argparse
 import random
 import columns_mechanics
+import columns_profiling
+import columns_replay
+import columns_rules
+
+
+pygame = None
+
+ROWS = 13
+COLUMNS = 6
+GAME_WINDOW = (360, 780)
+JEWELS = columns_rules.FALLER_JEWELS
+COLORS = {"S": (255, 0, 0),
+          "T": (255, 127, 0),
+          "V": (255, 242, 0),
+          "W": (118, 255, 0),
+          "X": (0, 255, 255),
+          "Y": (0, 4, 255),
+          "Z": (157, 0, 255)}
+
+
+def _import_pygame() -> None:
+    """
+    Imports pygame the first time a window is needed, so that importing this module for its tables
+    and configuration does not load the rendering library.
+    """
+    global pygame
+    if pygame is None:
+        import pygame
 
 
 class Game:
-    def __init__(self) -> None:
+    def __init__(self, seed: int = None, replay_path: str = None, profile_path: str = None) -> None:
         """
-        Initializes all of the Game data such as the rows and colum  ns. In addition, it initializes
-        the game state and generates a new field along with the seven jewels and their respective colors.
+        Initializes all of the Game data such as the rows and colum  ns along with the seven jewels and
+        their respective colors. The game state and its field are only created by run, together with the window.
+        The background with the grid and the rectangle of every cell are worked out again only when the
+        window is resized, and the field that was last drawn is kept to find the cells that changed.
+        The fallers are generated from the seed, which is picked at random if none is given, and every
+        tick and key press is written to a replay log if a replay path is given. If a profile path is
+        given, the game state methods and the loop and redraw phases are timed, the last times are shown
+        in a corner of the window, and the timings are written to the profile path when the game ends.
         """
-        self.rows = 13
-        self.columns = 6
+        self.rows = ROWS
+        self.columns = COLUMNS
+        self.seed = seed if seed is not None else random.randrange(1 << 63)
+        self.rng = random.Random(self.seed)
+        self.replay_path = replay_path
+        self._replay_writer = None
+        self.profile_path = profile_path
+        self._profiler = None
+        self._overlay_font = None
+        self._overlay_rect = None
         self._running = True
-        self.game_state = columns_mechanics.GameState(13, 6, "EMPTY", None)
-        self.field = self.game_state.create_new_field()
-        self.game_window = (360, 780)
-        self.jewels = ["S", "T", "V", "W", "X", "Y", "Z"]
-        self.colors = {"S": (255, 0, 0),
-                       "T": (255, 127, 0),
-                       "V": (255, 242, 0),
-                       "W": (118, 255, 0),
-                       "X": (0, 255, 255),
-                       "Y": (0, 4, 255),
-                       "Z": (157, 0, 255)}
-
+        self.game_state = None
+        self.field = None
+        self.game_window = GAME_WINDOW
+        self.jewels = list(JEWELS)
+        self.colors = dict(COLORS)
+        self._background = None
+        self._cell_rects = []
+        self._drawn_field = None
+        self._ready_for_faller = True
 
     def run(self) -> None:
         """
         Runs the entire game loop and causes a new faller to drop after the current faller
-        is frozen and matched jewels are checked and cleared.
+        is frozen and matched jewels are checked and cleared. The loop sleeps until the next
+        key press, timer tick or window event instead of redrawing at a fixed frame rate.
         """
+        _import_pygame()
+        self.game_state = columns_mechanics.GameState(self.rows, self.columns, "EMPTY", None)
+        self.field = self.game_state.create_new_field()
         pygame.init()
         pygame.time.set_timer(30, 500)
+        if self.profile_path is not None:
+            self._profiler = columns_profiling.Profiler()
+            self._profiler.install_game_state()
+            self._profiler.install(Game, ["_game_loop", "_redraw"])
+            self._overlay_font = pygame.font.Font(None, 20)
         self._resize_surface(self.game_window)
-        clock = pygame.time.Clock()
-
-        while self._running:
-            clock.tick(30)
-            self._game_loop()
-            self._redraw()
-            ready_for_faller = False
-            checker = True
-            for column in self.field:
-                for cell in column:
-                    if "*" in cell or "[" in cell or "|" in cell:
-                        checker = False
-            if checker:
-                ready_for_faller = True
-            if ready_for_faller:
-                self._create_faller()
-                self.field = self.game_state.drop(self.field, self.column_faller - 1, self.faller)
+        self.game_state.add_listener(self._handle_game_state_event)
+        if self.replay_path is not None:
+            self._replay_writer = columns_replay.ReplayWriter(self.replay_path, self.rows, self.columns, self.seed)
+        self._spawn_faller()
+
+        try:
+            while self._running:
+                self._game_loop([pygame.event.wait()] + pygame.event.get())
+                self._redraw()
+        finally:
+            if self._replay_writer is not None:
+                self._replay_writer.close()
+            if self._profiler is not None:
+                self._profiler.uninstall()
+                self._profiler.write(self.profile_path)
 
         pygame.quit()
 
+    def _handle_game_state_event(self, event: str) -> None:
+        """
+        Gets ready for a new faller once the board has settled and ends the game when the game state
+        reports that it is over.
+        """
+        if event == columns_mechanics.CASCADE_FINISHED:
+            self._ready_for_faller = True
+        elif event == columns_mechanics.GAME_OVER:
+            self._end_game()
+
+    def _spawn_faller(self) -> None:
+        """
+        Creates a new faller and drops it onto the field.
+        """
+        self._create_faller()
+        self.field = self.game_state.drop(self.field, self.column_faller - 1, self.faller)
+        self._ready_for_faller = False
+
     def _create_faller(self) -> None:
         """
         Generates a random faller in a random column.
         """
-        self.column_faller = random.randint(1, 6)
-        self.faller = [random.choice(self.jewels) for number in range(3)]
+        self.column_faller, self.faller = columns_rules.next_faller(self.rng, self.columns)
 
-    def _game_loop(self) -> None:
+    def _game_loop(self, events: ["pygame.event.Event"]) -> None:
         """
         Allows the user to handle the current faller by rotating and moving the faller left and right.
         If the faller lands and freezes, the field is checked for matching and clears matched jewels.
-        It also checks if the game has ended. The user is also capable of resizing the window.
+        It also checks if the game has ended and drops the next faller once the board has settled.
+        The user is also capable of resizing the window.
         """
-        for event in pygame.event.get():
+        for event in events:
 
             if event.type == pygame.QUIT:
                 self._end_game()
@@ -75,103 +139,143 @@ class Game:
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_LEFT:
                     self.field = self.game_state.move_left(self.field)
+                    self._record("LEFT")
                 elif event.key == pygame.K_RIGHT:
                     self.field = self.game_state.move_right(self.field)
+                    self._record("RIGHT")
                 elif event.key == pygame.K_SPACE:
                     self.field = self.game_state.rotate(self.field)
+                    self._record("SPACE")
 
             elif event.type == 30:
-                asterisks_present = self.game_state.checking_for_asterisks(self.field)
-                self.field = self.game_state.fall(self.field)
-                self.field = self.game_state.matching(self.field)
-                if asterisks_present:
-                    self.field = self.game_state.clear(self.field)
-                    self.field = self.game_state.matching(self.field)
-                if self.game_state.check_end_game(self.field, self.rows):
-                    self._end_game()
+                self._record("TICK")
+                self.field = columns_rules.run_tick(self.game_state, self.field, self.rows)[0]
+                if self._ready_for_faller and self._running:
+                    self._spawn_faller()
+
+    def _record(self, event: str) -> None:
+        """
+        Writes a tick or a key press to the replay log if one is being recorded.
+        """
+        if self._replay_writer is None:
+            return
+        if event == "TICK":
+            self._replay_writer.tick()
+        else:
+            self._replay_writer.key(event)
 
     def _redraw(self) -> None:
         """
-        Continuously redraws the entire field and applies the selected background color.
+        Redraws only the cells that changed since the last frame and updates just those parts of the
+        window. After a resize the whole window is drawn again from the cached background.
         """
         surface = pygame.display.get_surface()
-        surface.fill(pygame.Color(223, 217, 226))
-        self._draw_grid()
-        self._draw_jewels()
-
-        pygame.display.flip()
+        if self._drawn_field is None:
+            surface.blit(self._background, (0, 0))
+            for column_index, column in enumerate(self.field):
+                for cell_index in range(3, len(column)):
+                    if column[cell_index] != "   ":
+                        self._draw_jewel(surface, column_index, cell_index)
+            if self._profiler is not None:
+                self._draw_overlay(surface)
+            pygame.display.flip()
+            self._drawn_field = [column[:] for column in self.field]
+        else:
+            changed_rects = []
+            for column_index, column in enumerate(self.field):
+                drawn_column = self._drawn_field[column_index]
+                if column == drawn_column:
+                    continue
+                for cell_index in range(3, len(column)):
+                    if column[cell_index] != drawn_column[cell_index]:
+                        rectangle = self._cell_rects[column_index][cell_index - 3]
+                        surface.blit(self._background, rectangle, rectangle)
+                        if column[cell_index] != "   ":
+                            self._draw_jewel(surface, column_index, cell_index)
+                        changed_rects.append(rectangle)
+                self._drawn_field[column_index] = column[:]
+            if self._profiler is not None:
+                changed_rects.append(self._draw_overlay(surface))
+            if changed_rects:
+                pygame.display.update(changed_rects)
 
-    def _draw_grid(self) -> None:
+    def _draw_grid(self, surface: "pygame.Surface") -> None:
         """
         Draws the grid to help with the aesthetic of the game.
         """
-        surface = pygame.display.get_surface()
+        width, height = surface.get_size()
         color = (255, 255, 255)
         for num_rows in range(0, self.rows):
-            rectangle = (0, (num_rows / 13 - 0.0175) * pygame.display.Info().current_h,
-                         pygame.display.Info().current_w, pygame.display.Info().current_h / 104)
+            rectangle = (0, (num_rows / 13 - 0.0175) * height, width, height / 104)
 
             pygame.draw.rect(surface, color, rectangle)
 
         for num_columns in range(0, self.columns):
-            rectangle = ((num_columns / 6 - 0.045) * pygame.display.Info().current_w * 1.08, 0,
-                         pygame.display.Info().current_h / 104, pygame.display.Info().current_h)
+            rectangle = ((num_columns / 6 - 0.045) * width * 1.08, 0, height / 104, height)
 
             pygame.draw.rect(surface, color, rectangle)
 
-    def _draw_jewels(self) -> None:
+    def _draw_jewel(self, surface: "pygame.Surface", column_index: int, cell_index: int) -> None:
         """
-        Draws all of the current jewels on the field.
-        """
-        for column_index, column in enumerate(self.field):
-            for cell_index in range(3, len(column)):
-                if self.field[column_index][cell_index] != "   ":
-                    self._draw_jewel((column_index, cell_index - 3))
-
-    def _draw_jewel(self, jewel_coordinates: (int, int)) -> None:
+        Draws the jewel in the given cell and fills it with its respective color. If the jewel has
+        landed, it is black for an instance; if the jewel has matched, it is a light yellow for an instance.
         """
-        Using the coordinates of the jewel, the jewel is drawn and filled with its respective color.
-        If the jewel has landed, it is black for an instance; if the jewel has matched, it is a light
-        yellow for an instance.
-        """
-        fractional_x, fractional_y = jewel_coordinates[0] / 6, jewel_coordinates[1] / 13,
-        top_left_pixel_x, top_left_pixel_y = self._get_top_left_pixel_values(fractional_x, fractional_y)
-        top_left_pixel_x = 1.080 * top_left_pixel_x
-        surface = pygame.display.get_surface()
-        pixel_width, pixel_height = self._get_pixel_measurements()
-        rectangle = (top_left_pixel_x, top_left_pixel_y, pixel_width, pixel_height)
-
-        if self.field[jewel_coordinates[0]][jewel_coordinates[1] + 3].count("|") > 0:
+        cell = self.field[column_index][cell_index]
+        if cell.count("|") > 0:
             jewel_color = (0, 0, 0)
-        elif self.field[jewel_coordinates[0]][jewel_coordinates[1] + 3].count("*") > 0:
+        elif cell.count("*") > 0:
             jewel_color = (252, 255, 198)
         else:
-            jewel_color = self.colors[self.field[jewel_coordinates[0]][jewel_coordinates[1] + 3][1]]
+            jewel_color = self.colors[cell[1]]
 
-        pygame.draw.rect(surface, jewel_color, rectangle)
+        pygame.draw.rect(surface, jewel_color, self._cell_rects[column_index][cell_index - 3])
 
-    def _get_top_left_pixel_values(self, fractional_x: float, fractional_y: float) -> (float, float):
+    def _draw_overlay(self, surface: "pygame.Surface") -> "pygame.Rect":
         """
-        Acquires the top left pixel coordinates of the specific jewel.
+        Draws how long the last pass of the game loop and the last redraw took in the top left corner,
+        over the background and the jewels under it, and returns the area of the window that changed.
         """
-        pixel_x = fractional_x * pygame.display.Info().current_w
-        pixel_y = fractional_y * pygame.display.Info().current_h
-        return pixel_x, pixel_y
+        stats = self._profiler.stats
+        loop_time = stats["Game._game_loop"].last if "Game._game_loop" in stats else 0.0
+        frame_time = stats["Game._redraw"].last if "Game._redraw" in stats else 0.0
+        text = self._overlay_font.render(f"loop {loop_time * 1000:.2f} ms  frame {frame_time * 1000:.2f} ms",
+                                         True, (0, 0, 0))
+        rectangle = text.get_rect(topleft=(4, 4))
+        area = rectangle.union(self._overlay_rect) if self._overlay_rect is not None else rectangle
+
+        surface.blit(self._background, area, area)
+        for column_index, column in enumerate(self.field):
+            for cell_index in range(3, len(column)):
+                if column[cell_index] != "   " and area.colliderect(self._cell_rects[column_index][cell_index - 3]):
+                    self._draw_jewel(surface, column_index, cell_index)
+        surface.blit(text, rectangle)
 
-    def _get_pixel_measurements(self) -> (float, float):
+        self._overlay_rect = rectangle
+        return area
+
+    def _measure_cells(self, size: (int, int)) -> None:
         """
-        Acquires the pixel size (width and height) of the jewel.
+        Works out the rectangle of every visible cell for a window of the given size.
         """
-        pixel_width = 0.1 * pygame.display.Info().current_w
-        pixel_height = 0.05 * pygame.display.Info().current_h
-
-        return pixel_width, pixel_height
+        width, height = size
+        pixel_width, pixel_height = 0.1 * width, 0.05 * height
+        self._cell_rects = [[pygame.Rect(int(column_index / 6 * width * 1.080), int(row_index / 13 * height),
+                                         int(pixel_width), int(pixel_height))
+                             for row_index in range(self.rows)]
+                            for column_index in range(self.columns)]
 
     def _resize_surface(self, size: (int, int)) -> None:
         """
-        Allows the user to resize the window.
+        Allows the user to resize the window. The background and the cell rectangles are rebuilt
+        for the new size and the next frame redraws the whole window.
         """
-        pygame.display.set_mode(size, pygame.RESIZABLE)
+        surface = pygame.display.set_mode(size, pygame.RESIZABLE)
+        self._background = pygame.Surface(surface.get_size())
+        self._background.fill(pygame.Color(223, 217, 226))
+        self._draw_grid(self._background)
+        self._measure_cells(surface.get_size())
+        self._drawn_field = None
+        self._overlay_rect = None
 
     def _end_game(self) -> None:
         """
@@ -181,4 +285,10 @@ class Game:
 
 
 if __name__ == "__main__":
-    Game().run()
+    parser = argparse.ArgumentParser(description="Play Columns.")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--replay", metavar="PATH", help="record a replay log of the game to this file")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="time the game and write the timings to this file (.prom for Prometheus, else JSON)")
+    arguments = parser.parse_args()
+    Game(arguments.seed, arguments.replay, arguments.profile).run()
@@ -0,0 +1,169 @@
+import pytest
+
+import columns_grid
+import columns_loader
+import columns_mechanics
+
+
+BOARD_LINES = ["S  T", " X  ", "SZTV"]
+
+
+def settled_field(rows: int, columns: int, lines: [str]) -> [[str]]:
+    game_state = columns_mechanics.GameState(rows, columns, "CONTENTS", [[f" {jewel} " for jewel in line.ljust(columns)]
+                                                                         for line in lines])
+    return game_state.create_new_field()
+
+
+def test_load_text_settles_the_jewels():
+    grid = columns_loader.load_text(BOARD_LINES)
+
+    assert (grid.rows, grid.columns) == (3, 4)
+    assert grid.to_field() == settled_field(3, 4, BOARD_LINES)
+    assert grid.column_heights() == [2, 2, 1, 2]
+
+
+def test_load_text_pads_short_lines_and_takes_the_given_size():
+    grid = columns_loader.load_text(["S", "TV"], rows=5, columns=3)
+
+    assert (grid.rows, grid.columns) == (5, 3)
+    assert grid.column_heights() == [2, 1, 0]
+
+
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_load_text_file_with_either_line_ending(tmp_path, newline):
+    path = tmp_path / "board.txt"
+    path.write_bytes(newline.join(BOARD_LINES).encode("ascii") + newline.encode("ascii"))
+
+    assert columns_loader.load_text(path) == columns_loader.load_text(BOARD_LINES)
+    assert columns_loader.load_board(str(path)) == columns_loader.load_text(BOARD_LINES)
+
+
+def test_load_text_file_without_a_final_newline(tmp_path):
+    path = tmp_path / "board.txt"
+    path.write_text("\n".join(BOARD_LINES))
+
+    assert columns_loader.load_text(path) == columns_loader.load_text(BOARD_LINES)
+
+
+def test_load_text_rejects_a_letter_that_is_not_a_jewel():
+    with pytest.raises(ValueError, match="line 2 holds 'A'"):
+        columns_loader.load_text(["S  T", " A  "])
+
+
+def test_load_text_rejects_a_line_wider_than_the_board():
+    with pytest.raises(ValueError, match="5 cells wide"):
+        columns_loader.load_text(["STVWX"], columns=4)
+
+
+def test_load_text_rejects_more_lines_than_fit_into_the_field():
+    with pytest.raises(ValueError, match="do not fit"):
+        columns_loader.load_text(["S"] * 5, rows=1)
+
+
+def test_load_text_rejects_an_empty_file(tmp_path):
+    path = tmp_path / "board.txt"
+    path.write_bytes(b"")
+
+    with pytest.raises(ValueError, match="no columns"):
+        columns_loader.load_text(path)
+
+
+def test_empty_contents_block_gives_an_empty_field():
+    game_state = columns_mechanics.GameState(4, 3, "CONTENTS", [])
+
+    field = game_state.create_new_field()
+
+    assert field == [["   "] * 7 for column in range(3)]
+    assert not game_state.checking_for_asterisks(field)
+
+
+def test_binary_round_trip(tmp_path):
+    grid = columns_loader.load_text(BOARD_LINES, rows=6)
+    path = tmp_path / "board.clbd"
+
+    columns_loader.write_binary(path, grid)
+
+    assert columns_loader.decode_board(columns_loader.encode_board(grid)) == grid
+    assert columns_loader.load_binary(path) == grid
+    assert columns_loader.load_board(str(path)) == grid
+
+
+def test_binary_board_keeps_every_cell_state():
+    grid = columns_grid.Grid(2, 2)
+    grid.set(0, 2, columns_grid.FALLING | 1)
+    grid.set(0, 3, columns_grid.LANDED | 1)
+    grid.set(0, 4, columns_grid.MATCHED | 2)
+    grid.set(1, 4, 3)
+
+    assert columns_loader.decode_board(columns_loader.encode_board(grid)) == grid
+
+
+def test_binary_board_can_be_loaded_into_a_taller_field():
+    grid = columns_loader.load_text(BOARD_LINES)
+
+    taller = columns_loader.decode_board(columns_loader.encode_board(grid), rows=10)
+
+    assert (taller.rows, taller.columns) == (10, 4)
+    assert taller.column_heights() == grid.column_heights()
+
+
+def test_decode_board_rejects_a_truncated_header():
+    data = columns_loader.encode_board(columns_loader.load_text(BOARD_LINES))
+
+    with pytest.raises(ValueError, match="too short"):
+        columns_loader.decode_board(data[:columns_loader.BOARD_HEADER.size - 1])
+
+
+@pytest.mark.parametrize("cut", [1, 4])
+def test_decode_board_rejects_a_truncated_body(cut):
+    data = columns_loader.encode_board(columns_loader.load_text(BOARD_LINES))
+
+    with pytest.raises(ValueError, match="expected 24 cells"):
+        columns_loader.decode_board(data[:-cut])
+
+
+def test_decode_board_rejects_dimensions_that_do_not_match_the_cells():
+    data = columns_loader.encode_board(columns_loader.load_text(BOARD_LINES))
+    header = columns_loader.BOARD_HEADER.pack(columns_loader.BOARD_MAGIC, 3, 5, 6)
+
+    with pytest.raises(ValueError, match="expected 30 cells"):
+        columns_loader.decode_board(header + data[columns_loader.BOARD_HEADER.size:])
+
+
+def test_decode_board_rejects_a_field_too_short_for_the_stored_rows():
+    data = columns_loader.encode_board(columns_loader.load_text(BOARD_LINES))
+
+    with pytest.raises(ValueError, match="do not fit"):
+        columns_loader.decode_board(data, rows=1)
+
+
+def test_decode_board_rejects_bad_magic_and_bad_cells():
+    data = bytearray(columns_loader.encode_board(columns_loader.load_text(BOARD_LINES)))
+
+    with pytest.raises(ValueError, match="not a binary board"):
+        columns_loader.decode_board(b"XXXX" + data[4:])
+    data[-1] = 0x0F
+    with pytest.raises(ValueError, match="not a valid cell"):
+        columns_loader.decode_board(data)
+
+
+def test_load_binary_rejects_truncated_files(tmp_path):
+    data = columns_loader.encode_board(columns_loader.load_text(BOARD_LINES))
+    path = tmp_path / "board.clbd"
+
+    path.write_bytes(b"")
+    with pytest.raises(ValueError, match="too short"):
+        columns_loader.load_binary(path)
+    path.write_bytes(data[:8])
+    with pytest.raises(ValueError, match="too short"):
+        columns_loader.load_binary(path)
+    path.write_bytes(data[:-1])
+    with pytest.raises(ValueError, match="expected 24 cells"):
+        columns_loader.load_binary(path)
+
+
+def test_load_grid_rejects_a_grid_of_another_size():
+    game_state = columns_mechanics.GameState(4, 3, "EMPTY", [])
+
+    with pytest.raises(ValueError, match="cannot load a 3x4 grid"):
+        game_state.load_grid(columns_loader.load_text(BOARD_LINES))
@@ -0,0 +1,95 @@
+import io
+import random
+
+import pytest
+
+import columns_headless
+import columns_replay
+
+
+def recorded_game(seed: int, ticks: int = 300) -> (bytes, columns_headless.GameResult):
+    log = io.BytesIO()
+    writer = columns_replay.ReplayWriter(log, 13, 6, seed)
+    game = columns_headless.HeadlessGame(13, 6, seed, recorder=writer)
+    game.spawn()
+    keys = random.Random(seed)
+    while game.end_reason is None and game.ticks < ticks:
+        for press in range(keys.randrange(3)):
+            game.press(keys.choice(columns_headless.KEYS))
+        game.tick()
+        if game.end_reason is None and game.ready_for_faller():
+            game.spawn()
+    writer.flush()
+    return log.getvalue(), game.result()
+
+
+def header(seed: int = 7) -> bytes:
+    return columns_replay.HEADER.pack(columns_replay.MAGIC, columns_replay.VERSION, 13, 6, seed)
+
+
+def test_runs_are_expanded():
+    replay = columns_replay.decode_replay(header() + bytes([0x00, 0x3F, 0x41, 0x80 | 2, 0xFF]))
+
+    assert (replay.rows, replay.columns, replay.seed) == (13, 6, 7)
+    assert replay.events == bytearray([columns_replay.TICK] * 65 + [columns_replay.LEFT] * 2
+                                      + [columns_replay.RIGHT] * 3 + [columns_replay.SPACE] * 64)
+    assert replay.ticks == 65
+
+
+def test_writer_splits_long_runs():
+    log = io.BytesIO()
+    with columns_replay.ReplayWriter(log, 13, 6, 7) as writer:
+        for tick in range(130):
+            writer.tick()
+        writer.key("LEFT")
+
+    assert log.getvalue() == header() + bytes([0x3F, 0x3F, 0x01, 0x40])
+    assert columns_replay.decode_replay(log.getvalue()).ticks == 130
+
+
+def test_header_only_log_has_no_events():
+    assert columns_replay.decode_replay(header()).events == bytearray()
+
+
+@pytest.mark.parametrize("size", [0, 1, columns_replay.HEADER.size - 1])
+def test_truncated_header_is_rejected(size):
+    with pytest.raises(ValueError, match="too short"):
+        columns_replay.decode_replay(header()[:size])
+
+
+def test_bad_magic_and_version_are_rejected():
+    with pytest.raises(ValueError, match="not a replay log"):
+        columns_replay.decode_replay(b"XXXX" + header()[4:])
+    with pytest.raises(ValueError, match="unsupported replay log version 9"):
+        columns_replay.decode_replay(columns_replay.HEADER.pack(columns_replay.MAGIC, 9, 13, 6, 7))
+
+
+def test_unknown_key_is_rejected():
+    with pytest.raises(ValueError, match="unknown key"):
+        columns_replay.ReplayWriter(io.BytesIO(), 13, 6, 7).key("UP")
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_replay_reproduces_the_game(seed):
+    log, result = recorded_game(seed)
+    replayer = columns_replay.Replayer(columns_replay.decode_replay(log), snapshot_interval=50)
+
+    assert replayer.run().as_dict() == result.as_dict()
+
+
+def test_seek_back_and_forth_matches_a_fresh_replay():
+    replay = columns_replay.decode_replay(recorded_game(3)[0])
+    replayer = columns_replay.Replayer(replay, snapshot_interval=25)
+    replayer.run()
+
+    for tick in (120, 10, 75, 0, 120):
+        assert replayer.seek(tick).field == columns_replay.Replayer(replay).seek(tick).field
+
+
+def test_truncated_log_replays_its_prefix():
+    log, result = recorded_game(1)
+    replay = columns_replay.decode_replay(log[:columns_replay.HEADER.size + 10])
+
+    game = columns_replay.Replayer(replay).run()
+
+    assert game.ticks == replay.ticks <= result.ticks
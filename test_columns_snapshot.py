@@ -0,0 +1,126 @@
+import random
+
+import pytest
+
+import columns_cache
+import columns_headless
+import columns_mechanics
+import columns_snapshot
+
+
+def played_games(count: int = 20, ticks: int = 60) -> [columns_headless.HeadlessGame]:
+    games = []
+    for seed in range(count):
+        game = columns_headless.HeadlessGame(13, 6, seed)
+        game.spawn()
+        keys = random.Random(seed)
+        while game.end_reason is None and game.ticks < ticks + seed:
+            game.press(keys.choice(columns_headless.KEYS))
+            game.tick()
+            if game.end_reason is None and game.ready_for_faller():
+                game.spawn()
+        games.append(game)
+
+    return games
+
+
+def faller_state(game_state: columns_mechanics.GameState) -> tuple:
+    faller = game_state.faller
+    return None if faller is None else (faller.column, faller.top, faller.jewels, faller.landed)
+
+
+@pytest.mark.parametrize("hashed", [False, True])
+def test_restore_gives_an_identical_field_and_hash(hashed):
+    for game in played_games():
+        game_state = game.game_state
+        if hashed:
+            game_state.board_hash(game.field)
+        restored = columns_mechanics.GameState(13, 6, "EMPTY", [])
+
+        field = restored.restore(game_state.snapshot())
+
+        assert field == game.field
+        assert faller_state(restored) == faller_state(game_state)
+        assert restored.checking_for_asterisks(field) == game_state.checking_for_asterisks(game.field)
+        assert restored.board_hash(field) == game_state.board_hash(game.field) == columns_cache.board_hash(field)
+
+
+def test_restored_game_plays_on_like_the_original():
+    for game in played_games(count=10):
+        copy = columns_headless.HeadlessGame(13, 6, 0)
+        copy.restore(game.snapshot())
+        for tick in range(40):
+            for playing in (game, copy):
+                playing.tick()
+                if playing.end_reason is None and playing.ready_for_faller():
+                    playing.spawn()
+
+            assert copy.field == game.field
+            assert (copy.score, copy.end_reason) == (game.score, game.end_reason)
+
+
+def test_restore_rejects_bad_snapshots():
+    snapshot = played_games(count=1)[0].game_state.snapshot()
+    game_state = columns_mechanics.GameState(13, 6, "EMPTY", [])
+
+    with pytest.raises(ValueError, match="not a game state snapshot"):
+        game_state.restore(b"XXXX" + snapshot[4:])
+    with pytest.raises(ValueError, match="expected a snapshot"):
+        game_state.restore(snapshot[:-1])
+    with pytest.raises(ValueError, match="cannot restore a 13x6 snapshot"):
+        columns_mechanics.GameState(12, 6, "EMPTY", []).restore(snapshot)
+
+
+def test_batch_round_trip(tmp_path):
+    snapshots = [game.game_state.snapshot() for game in played_games(count=5)]
+    path = tmp_path / "batch.clsb"
+
+    assert columns_snapshot.write_snapshots(path, snapshots) == 5
+    with columns_snapshot.SnapshotBatch(path) as batch:
+        assert len(batch) == 5
+        assert [bytes(snapshot) for snapshot in batch] == snapshots
+        assert bytes(batch[-1]) == snapshots[-1]
+        game_state = columns_mechanics.GameState(13, 6, "EMPTY", [])
+        restored = [game_state.restore(snapshot) for snapshot in batch]
+        with pytest.raises(IndexError):
+            batch[5]
+
+    assert restored[2] == columns_mechanics.GameState(13, 6, "EMPTY", []).restore(snapshots[2])
+
+
+def test_write_snapshots_rejects_mixed_sizes(tmp_path):
+    with pytest.raises(ValueError, match="same size"):
+        columns_snapshot.write_snapshots(tmp_path / "batch.clsb", [b"a" * 10, b"a" * 11])
+    with pytest.raises(ValueError, match="no snapshots"):
+        columns_snapshot.write_snapshots(tmp_path / "batch.clsb", [])
+
+
+@pytest.mark.parametrize("size", [0, 1, columns_snapshot.BATCH_HEADER.size - 1])
+def test_batch_rejects_a_truncated_header(tmp_path, size):
+    snapshots = [game.game_state.snapshot() for game in played_games(count=2)]
+    path = tmp_path / "batch.clsb"
+    columns_snapshot.write_snapshots(path, snapshots)
+    path.write_bytes(path.read_bytes()[:size])
+
+    with pytest.raises(ValueError, match="snapshot batch"):
+        columns_snapshot.SnapshotBatch(path)
+
+
+@pytest.mark.parametrize("cut", [1, 40])
+def test_batch_rejects_a_truncated_body(tmp_path, cut):
+    snapshots = [game.game_state.snapshot() for game in played_games(count=2)]
+    path = tmp_path / "batch.clsb"
+    columns_snapshot.write_snapshots(path, snapshots)
+    path.write_bytes(path.read_bytes()[:-cut])
+
+    with pytest.raises(ValueError, match="not a snapshot batch"):
+        columns_snapshot.SnapshotBatch(path)
+
+
+def test_batch_rejects_bad_magic(tmp_path):
+    path = tmp_path / "batch.clsb"
+    columns_snapshot.write_snapshots(path, [b"a" * 10])
+    path.write_bytes(b"XXXX" + path.read_bytes()[4:])
+
+    with pytest.raises(ValueError, match="not a snapshot batch"):
+        columns_snapshot.SnapshotBatch(path)